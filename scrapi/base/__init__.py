@@ -3,16 +3,24 @@ from __future__ import unicode_literals
 
 import abc
 import logging
+from urllib import quote
+from copy import deepcopy
+from collections import Counter, OrderedDict
 from datetime import date, timedelta
+from multiprocessing.pool import ThreadPool
 
 from lxml import etree
+from dateutil.parser import parse
 from celery.schedules import crontab
 
 from scrapi import util
+from scrapi import events
+from scrapi import metrics
 from scrapi import requests
+from scrapi import checkpoints
 from scrapi.linter import lint
 from scrapi.base.schemas import OAISCHEMA
-from scrapi.base.helpers import updated_schema
+from scrapi.base.helpers import updated_schema, parsed_in_process, OAIPageReader
 from scrapi.base.transformer import XMLTransformer
 from scrapi.linter.document import RawDocument, NormalizedDocument
 
@@ -64,6 +72,9 @@ class BaseHarvester(object):
     """
     __metaclass__ = HarvesterMeta
 
+    # Documents per normalization task, None uses settings.NORMALIZE_BATCH_SIZE
+    normalize_batch_size = None
+
     @abc.abstractproperty
     def short_name(self):
         raise NotImplementedError
@@ -103,8 +114,18 @@ class BaseHarvester(object):
 class XMLHarvester(BaseHarvester, XMLTransformer):
     file_format = 'xml'
 
+    def parse_doc(self, raw_doc):
+        """ The doc of raw_doc as an element, parsed at most once per process
+        """
+        if getattr(raw_doc, 'parsed', None) is None:
+            element = etree.XML(raw_doc['doc'])
+            if not isinstance(raw_doc, RawDocument):
+                return element
+            raw_doc.parsed = element
+        return raw_doc.parsed
+
     def normalize(self, raw_doc):
-        transformed = self.transform(etree.XML(raw_doc['doc']))
+        transformed = self.transform(self.parse_doc(raw_doc))
         transformed['source'] = self.short_name
         return NormalizedDocument(transformed)
 
@@ -124,7 +145,11 @@ class OAIHarvester(XMLHarvester):
     DEFAULT_ENCODING = 'UTF-8'
     RESUMPTION = '&resumptionToken='
     RECORDS_URL = '?verb=ListRecords'
+    IDENTIFIERS_URL = '?verb=ListIdentifiers'
+    GET_RECORD_URL = '?verb=GetRecord&metadataPrefix=oai_dc&identifier={}'
     META_PREFIX_DATE = '&metadataPrefix=oai_dc&from={}'
+    UNTIL_DATE = '&until={}'
+    SET_SPEC = '&set={}'
 
     # Override these variable is required
     namespaces = {
@@ -138,8 +163,33 @@ class OAIHarvester(XMLHarvester):
     timezone_granularity = False
     property_list = ['date', 'language', 'type']
 
+    # Set to split the harvest window into slices of this many days,
+    # which are harvested concurrently by at most max_concurrency threads.
+    # Every thread shares the same per host rate limit, starting at timeout.
+    slice_days = None
+    max_concurrency = 4
+
+    # Set to request each of the approved_sets separately rather than
+    # harvesting the whole repository. set_spec_prefix is prepended to each
+    # set, for providers whose setSpecs look like "publication:<set>".
+    harvest_by_set = False
+    set_spec_prefix = ''
+
+    # Set to list identifiers first and only GetRecord those that are new or
+    # whose datestamp differs from the dateUpdated already stored in Cassandra
+    delta_harvest = False
+
     @property
     def schema(self):
+        """ Built once per instance, and again only if property_list changes
+        """
+        key = tuple(self.property_list)
+        cached = getattr(self, '_schema', None)
+        if cached is None or cached[0] != key:
+            cached = self._schema = (key, self.build_schema())
+        return cached[1]
+
+    def build_schema(self):
         properties = {
             'properties': {
                 item: (
@@ -163,56 +213,300 @@ class OAIHarvester(XMLHarvester):
             return [dc, ns0]
 
     def harvest(self, days_back=1):
+        return list(self.harvest_iter(days_back=days_back))
+
+    def harvest_iter(self, days_back=1):
+        """ Lazily harvest the given window, yielding a RawDocument per record.
+
+        Only the current page of results is ever held in memory.
+        """
+        for page in self.harvest_pages(days_back=days_back):
+            for raw_doc in page:
+                yield raw_doc
+
+    def harvest_pages(self, days_back=1, resumable=False):
+        """ Harvest the given window one page at a time, yielding a list of
+        RawDocuments per page of the ListRecords response.
+
+        If resumable is set, progress is checkpointed after each page has been
+        consumed and a previous, unfinished run of the same window is resumed.
+
+        If slice_days or harvest_by_set is set the window is harvested
+        concurrently in slices and the merged result is yielded as a single page.
 
-        start_date = str(date.today() - timedelta(int(days_back)))
+        If delta_harvest is set, each page of ListIdentifiers is yielded as
+        the list of records that have changed since they were last stored.
 
-        records_url = self.base_url + self.RECORDS_URL
-        request_url = records_url + self.META_PREFIX_DATE.format(start_date)
+        Records dropped by record_filters never become RawDocuments.
+        """
+        start_date = date.today() - timedelta(int(days_back))
+
+        if self.delta_harvest:
+            for page in self.harvest_delta(start_date, resumable=resumable):
+                yield page
+            return
+
+        if self.slice_days or self.harvest_by_set:
+            if resumable:
+                logger.info('Sliced harvests of "{}" are not checkpointed'.format(self.short_name))
+            yield self.harvest_windows(self.windows(start_date))
+            return
+
+        dropped = Counter()
+        for page in self.iter_pages(self.window_url(start_date), str(start_date), resumable=resumable):
+            yield [self.to_raw_document(record) for record in self.filter_records(page, dropped)]
+
+        self.report_dropped(dropped)
+
+    def window_url(self, from_date, until_date=None, set_spec=None, identifiers=False):
+        url = self.base_url + (self.IDENTIFIERS_URL if identifiers else self.RECORDS_URL)
+        url += self.META_PREFIX_DATE.format(from_date)
 
         if self.timezone_granularity:
-            request_url += 'T00:00:00Z'
+            url += 'T00:00:00Z'
+
+        if until_date:
+            url += self.UNTIL_DATE.format(until_date)
+            if self.timezone_granularity:
+                url += 'T23:59:59Z'
+
+        if set_spec:
+            url += self.SET_SPEC.format(set_spec)
+
+        return url
+
+    def windows(self, start_date):
+        """ Every (from, until, set) window to harvest, one per date slice and
+        approved set
+        """
+        if self.slice_days:
+            dates = self.date_windows(start_date)
+        else:
+            dates = [(start_date, None)]
+
+        if self.harvest_by_set and self.approved_sets:
+            sets = [self.set_spec_prefix + set_spec for set_spec in self.approved_sets]
+        else:
+            sets = [None]
+
+        return [(from_date, until_date, set_spec) for from_date, until_date in dates for set_spec in sets]
+
+    def date_windows(self, start_date):
+        """ Split everything from start_date onwards into (from, until) slices
+        of slice_days days. The last slice is left open ended.
+        """
+        windows = []
+        step = timedelta(self.slice_days)
+
+        while start_date + step <= date.today():
+            windows.append((start_date, start_date + step - timedelta(1)))
+            start_date += step
+
+        return windows + [(start_date, None)]
+
+    def harvest_windows(self, windows):
+        """ Concurrently harvest each (from, until, set) window. Records are merged
+        and deduplicated by identifier, keeping the most recently stamped copy.
+        """
+        pool = ThreadPool(min(self.max_concurrency, len(windows)))
+        dropped = Counter()
+
+        try:
+            results = pool.map(metrics.bind(lambda window: self.harvest_window(*window)), windows)
+        finally:
+            pool.close()
+
+        for _, window_dropped in results:
+            dropped.update(window_dropped)
+        self.report_dropped(dropped)
+
+        merged = OrderedDict()
+        for datestamp, raw_doc in (item for result, _ in results for item in result):
+            if raw_doc['docID'] not in merged or merged[raw_doc['docID']][0] < datestamp:
+                merged[raw_doc['docID']] = (datestamp, raw_doc)
+
+        return [raw_doc for _, raw_doc in merged.values()]
+
+    def harvest_window(self, from_date, until_date=None, set_spec=None):
+        """ Harvest a single window, returning a list of (datestamp, RawDocument)
+        pairs and a Counter of the records dropped by record_filters
+        """
+        dropped = Counter()
+        records = self.iter_records(self.window_url(from_date, until_date, set_spec), str(from_date))
+        return [
+            (record.findtext('ns0:header/ns0:datestamp', namespaces=self.namespaces), self.to_raw_document(record))
+            for record in self.filter_records(records, dropped)
+        ], dropped
+
+    def harvest_delta(self, start_date, resumable=False):
+        """ Walk ListIdentifiers for the window and GetRecord, concurrently,
+        only the identifiers that are new or have changed since they were
+        stored. Yields a list of RawDocuments per page of identifiers.
+        """
+        dropped = Counter()
+        pool = ThreadPool(self.max_concurrency)
+
+        try:
+            url = self.window_url(start_date, identifiers=True)
+            for page in self.iter_pages(url, str(start_date), resumable=resumable, identifiers=True):
+                headers = OrderedDict(
+                    (header.findtext('ns0:identifier', namespaces=self.namespaces), header.findtext('ns0:datestamp', namespaces=self.namespaces))
+                    for header in self.filter_headers(page, dropped)
+                )
+
+                stored = self.stored_dates(headers.keys())
+                changed = [
+                    identifier for identifier, datestamp in headers.items()
+                    if stored.get(identifier) != unicode(parse(datestamp).isoformat())
+                ]
+                dropped['unchanged'] += len(headers) - len(changed)
+
+                yield [raw_doc for raw_docs in pool.map(metrics.bind(self.get_record), changed) for raw_doc in raw_docs]
+        finally:
+            pool.close()
+
+        self.report_dropped(dropped)
+
+    def get_record(self, identifier):
+        url = self.base_url + self.GET_RECORD_URL.format(quote(identifier.encode('utf-8'), safe=':/'))
+        data = requests.get(url, throttle=self.timeout, stream=True)
+        return [
+            self.to_raw_document(record)
+            for record in OAIPageReader(data.raw, namespace=self.namespaces['ns0'])
+        ]
+
+    def stored_dates(self, identifiers):
+        """ Map each identifier that has already been stored to its dateUpdated
+        """
+        # Imported here as the processors import the harvester registry
+        from scrapi.processing.cassandra import DocumentModel
+
+        if not identifiers:
+            return {}
+
+        return {
+            document.docID: document.dateUpdated
+            for document in DocumentModel.objects(docID__in=list(identifiers), source=self.short_name)
+        }
+
+    @property
+    def record_filters(self):
+        """ Cheap checks run against each record's header before it is turned
+        into a RawDocument. Each returns the reason for dropping the record,
+        or None to keep it.
+        """
+        return [self.filter_deleted, self.filter_unapproved_set]
+
+    def filter_deleted(self, header):
+        if header.get('status') == 'deleted':
+            return 'deleted'
+
+    def filter_unapproved_set(self, header):
+        if not self.approved_sets:
+            return None
 
-        records = self.get_records(request_url, start_date)
+        set_spec = header.xpath('ns0:setSpec/node()', namespaces=self.namespaces)
+        if not {x.replace('publication:', '') for x in set_spec}.intersection(self.approved_sets):
+            return 'unapproved_set'
 
-        rawdoc_list = []
+    def filter_records(self, records, dropped):
+        """ Yield the records that pass every record filter, counting the
+        dropped ones by reason in dropped
+        """
         for record in records:
-            doc_id = record.xpath(
-                'ns0:header/ns0:identifier', namespaces=self.namespaces)[0].text
-            record = etree.tostring(record, encoding=self.record_encoding)
-            rawdoc_list.append(RawDocument({
-                'doc': record,
-                'source': util.copy_to_unicode(self.short_name),
-                'docID': util.copy_to_unicode(doc_id),
-                'filetype': 'xml'
-            }))
-
-        return rawdoc_list
-
-    def get_records(self, url, start_date, resump_token=''):
-        data = requests.get(url, throttle=self.timeout)
-
-        doc = etree.XML(data.content)
-
-        records = doc.xpath(
-            '//ns0:record',
-            namespaces=self.namespaces
-        )
-        token = doc.xpath(
-            '//ns0:resumptionToken/node()',
-            namespaces=self.namespaces
-        )
-        if len(token) == 1:
-            base_url = url.replace(
-                self.META_PREFIX_DATE.format(start_date), '')
-            base_url = base_url.replace(self.RESUMPTION + resump_token, '')
-            url = base_url + self.RESUMPTION + token[0]
-            records += self.get_records(url, start_date, resump_token=token[0])
-
-        return records
+            if self.keep_header(record.find('ns0:header', namespaces=self.namespaces), dropped):
+                yield record
+
+    def filter_headers(self, headers, dropped):
+        for header in headers:
+            if self.keep_header(header, dropped):
+                yield header
+
+    def keep_header(self, header, dropped):
+        for check in self.record_filters:
+            reason = check(header)
+            if reason:
+                dropped[reason] += 1
+                return False
+        return True
+
+    def report_dropped(self, dropped):
+        for reason, count in dropped.items():
+            logger.info('Dropped {} records from "{}" during harvest: {}'.format(count, self.short_name, reason))
+
+        if dropped:
+            events.dispatch(events.HARVEST_FILTER, events.COMPLETED, harvester=self.short_name, dropped=dict(dropped))
+
+    def to_raw_document(self, record):
+        doc_id = record.xpath(
+            'ns0:header/ns0:identifier', namespaces=self.namespaces)[0].text
+        # Records are freed once they have been read, carry a standalone copy along
+        return RawDocument({
+            'doc': etree.tostring(record, encoding=self.record_encoding),
+            'source': util.copy_to_unicode(self.short_name),
+            'docID': util.copy_to_unicode(doc_id),
+            'filetype': 'xml'
+        }, parsed=parsed_in_process(record))
+
+    def get_records(self, url, start_date):
+        # iter_records frees each record once it has been consumed, keep copies
+        return [deepcopy(record) for record in self.iter_records(url, start_date)]
+
+    def iter_records(self, url, start_date):
+        """ Yield every record in the ListRecords response at url, following
+        resumptionTokens page by page until the list is exhausted.
+
+        Records are only valid until the next one is requested.
+        """
+        for page in self.iter_pages(url, start_date):
+            for record in page:
+                yield record
+
+    def iter_pages(self, url, start_date, resumable=False, identifiers=False):
+        """ Yield an OAIPageReader for each page of the ListRecords (or, if
+        identifiers is set, ListIdentifiers) response at url, following
+        resumptionTokens until the list is exhausted.
+
+        When resumable, a checkpoint is committed once each page has been
+        consumed and cleared when the list is exhausted.
+        """
+        page_count = 0
+        start_url = url
+        base_url = self.base_url + (self.IDENTIFIERS_URL if identifiers else self.RECORDS_URL)
+        element = 'header' if identifiers else 'record'
+
+        checkpoint = resumable and checkpoints.load(self.short_name, start_date)
+        if checkpoint:
+            logger.info('Resuming harvest of "{}" after page {}'.format(self.short_name, checkpoint.page_count))
+            page_count = checkpoint.page_count
+            url = base_url + self.RESUMPTION + checkpoint.resumption_token
+
+        while url:
+            data = requests.get(url, throttle=self.timeout, stream=True)
+            page = OAIPageReader(data.raw, namespace=self.namespaces['ns0'], element=element)
+
+            yield page
+
+            if page.error and page.error != 'noRecordsMatch':
+                logger.warning('Got OAI error "{}" from "{}"'.format(page.error, url))
+
+            if checkpoint and page.error == 'badResumptionToken':
+                logger.warning('ResumptionToken for "{}" is no longer valid, restarting harvest'.format(self.short_name))
+                checkpoint, page_count, url = None, 0, start_url
+                continue
+
+            checkpoint = None
+            page_count += 1
+            url = base_url + self.RESUMPTION + page.resumption_token if page.resumption_token else None
+
+            if resumable and url:
+                checkpoints.commit(self.short_name, start_date, page.resumption_token, page_count, expires=page.token_expiration)
+
+        if resumable:
+            checkpoints.clear(self.short_name)
 
     def normalize(self, raw_doc):
-        str_result = raw_doc.get('doc')
-        result = etree.XML(str_result)
+        result = self.parse_doc(raw_doc)
 
         if self.approved_sets:
             set_spec = result.xpath(
@@ -1,8 +1,15 @@
 from __future__ import unicode_literals
 
+from io import BytesIO
 from copy import deepcopy
+
+from lxml import etree
 from nameparser import HumanName
 
+from scrapi import settings
+
+OAI_NAMESPACE = 'http://www.openarchives.org/OAI/2.0/'
+
 
 def updated_schema(old, new):
     d = deepcopy(old)
@@ -14,6 +21,17 @@ def updated_schema(old, new):
     return d
 
 
+def parsed_in_process(element, copy=True):
+    """ The element to hand to a RawDocument as parsed, when it will be normalized in
+    this process. Otherwise None, as it would only be dropped once the document is pickled.
+
+    copy makes a standalone document of an element that is part of a larger tree.
+    """
+    if not settings.CELERY_ALWAYS_EAGER:
+        return None
+    return deepcopy(element) if copy else element
+
+
 def default_name_parser(names):
     contributor_list = []
     for person in names:
@@ -74,3 +92,39 @@ def oai_process_contributors(*args):
 
 def pack(*args, **kwargs):
     return args, kwargs
+
+
+class OAIPageReader(object):
+    """ Incrementally reads the records out of a single OAI-PMH response.
+
+    Iterating yields each <record> (or <header>, for ListIdentifiers) element
+    as soon as its closing tag is parsed; once the consumer moves on, the
+    element is cleared and dropped from the tree. The resumptionToken and any OAI error code are picked up
+    on the way through and are available once iteration has finished.
+    """
+
+    def __init__(self, source, namespace=OAI_NAMESPACE, element='record'):
+        self.source = source if hasattr(source, 'read') else BytesIO(source)
+        self.record_tag = '{{{}}}{}'.format(namespace, element)
+        self.token_tag = '{{{}}}resumptionToken'.format(namespace)
+        self.error_tag = '{{{}}}error'.format(namespace)
+        self.error = None
+        self.resumption_token = None
+        self.token_expiration = None
+
+    def __iter__(self):
+        tags = (self.record_tag, self.token_tag, self.error_tag)
+        for _, element in etree.iterparse(self.source, events=('end', ), tag=tags):
+            if element.tag == self.token_tag:
+                self.resumption_token = element.text or None
+                self.token_expiration = element.get('expirationDate')
+                continue
+
+            if element.tag == self.error_tag:
+                self.error = element.get('code')
+                continue
+
+            yield element
+
+            element.clear()
+            element.getparent().remove(element)
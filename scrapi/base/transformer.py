@@ -1,10 +1,21 @@
 from __future__ import unicode_literals
 
+import re
 import abc
 import logging
+import functools
+import threading
+
+from lxml import etree
 
 logger = logging.getLogger(__name__)
 
+# Expressions of the form //prefix:tag/node(), see TagIndex
+TAG_NODES = re.compile(r'^//([A-Za-z_][\w.-]*):([A-Za-z_][\w.-]*)/node\(\)$')
+
+# The TagIndex of the document each thread is transforming
+_current = threading.local()
+
 
 class BaseTransformer(object):
 
@@ -23,7 +34,73 @@ class BaseTransformer(object):
         raise NotImplementedError
 
     def transform(self, doc):
-        return self._transform(self.schema, doc)
+        containers = [{}]
+        for parent, key, step in self._plan():
+            if step is None:
+                value = {}
+                containers.append(value)
+            else:
+                value = step(doc)
+            containers[parent][key] = value
+        return containers[0]
+
+    def _plan(self):
+        """ The compiled plan for the current schema, rebuilt whenever the
+        schema (or namespaces) changes. Schemas are not expected to be
+        modified in place.
+
+        Schemas and namespaces built afresh on every access, by properties,
+        are compared by value so that they still compile only once.
+        """
+        schema, namespaces = self.schema, getattr(self, 'namespaces', None)
+        cached = getattr(self, '_cached_plan', None)
+        if cached is None or not (_same(cached[0], schema) and _same(cached[1], namespaces)):
+            cached = self._cached_plan = (schema, namespaces, self._compile(schema))
+        return cached[2]
+
+    def _compile(self, schema, plan=None, parent=0):
+        """ Flatten schema into a list of (parent, key, step) in the order that
+        _transform would evaluate it. parent indexes the dicts created so far,
+        the output itself being 0, and a step of None creates a new dict.
+        Values that _transform would skip are left out.
+        """
+        if plan is None:
+            plan = []
+
+        for key, value in schema.items():
+            if isinstance(value, dict):
+                plan.append((parent, key, None))
+                self._compile(value, plan, sum(1 for step in plan if step[2] is None))
+            elif isinstance(value, list) or isinstance(value, tuple):
+                plan.append((parent, key, self._compile_iterable(value)))
+            elif isinstance(value, basestring):
+                plan.append((parent, key, self._compile_string(value)))
+        return plan
+
+    def _compile_string(self, string):
+        return functools.partial(self._transform_string, string)
+
+    def _compile_iterable(self, l):
+        if not l:
+            return functools.partial(self._transform_iterable, l)
+
+        if isinstance(l[0], tuple) and len(l) == 2:
+            return self._compile_args_kwargs(l)
+
+        steps = []
+        for value in l:
+            if isinstance(value, basestring):
+                steps.append(self._compile_string(value))
+            elif callable(value):
+                return functools.partial(_call_with, value, steps, ())
+
+        return functools.partial(_evaluate_then_none, steps)
+
+    def _compile_args_kwargs(self, l):
+        fn, t = l[1], l[0]
+        args = [self._compile_string(arg) for arg in t[0]]
+        kwargs = [(k, self._compile_string(v)) for k, v in t[1].items()] if len(t) == 2 else []
+        return functools.partial(_call_with, fn, args, kwargs)
 
     def _transform(self, schema, doc):
         transformed = {}
@@ -68,10 +145,104 @@ class XMLTransformer(BaseTransformer):
 
     __metaclass__ = abc.ABCMeta
 
+    # Answer //prefix:tag/node() from a single walk of each document
+    # rather than searching the whole document for every schema entry
+    bucket_tags = True
+
+    def transform(self, doc):
+        previous, _current.index = getattr(_current, 'index', None), TagIndex(doc)
+        try:
+            return super(XMLTransformer, self).transform(doc)
+        finally:
+            _current.index = previous
+
     def _transform_string(self, string, doc):
         val = doc.xpath(string, namespaces=self.namespaces)
-        return '' if not val else unicode(val[0]) if len(val) == 1 else [unicode(v) for v in val]
+        return _format_xpath_result(val)
+
+    def _compile_string(self, string):
+        overridden = type(self)._transform_string.__func__ is not XMLTransformer._transform_string.__func__
+        try:
+            if overridden:
+                raise TypeError
+            xpath = etree.XPath(string, namespaces=self.namespaces)
+        except (etree.XPathError, TypeError, ValueError):
+            # Leave anything that does not compile to fail (or not) exactly as it would have
+            return super(XMLTransformer, self)._compile_string(string)
+
+        match = self.bucket_tags and TAG_NODES.match(string)
+        if match and self.namespaces.get(match.group(1)):
+            tag = '{{{}}}{}'.format(self.namespaces[match.group(1)], match.group(2))
+            return functools.partial(_evaluate_tag_nodes, tag, xpath)
+
+        return functools.partial(_evaluate_xpath, xpath)
 
     @abc.abstractproperty
     def namespaces(self):
         raise NotImplementedError
+
+
+class TagIndex(object):
+    """ The elements of a document bucketed by tag, from one walk of the whole
+    document (as // searches it all, whichever element it starts from).
+    Built the first time it is asked for.
+    """
+
+    def __init__(self, doc):
+        self.doc = doc
+        self._buckets = None
+
+    def _build(self):
+        root = self.doc.getroottree().getroot() if hasattr(self.doc, 'getroottree') else self.doc.getroot()
+        self._buckets = {}
+        for element in root.iter():
+            self._buckets.setdefault(element.tag, []).append(element)
+
+    def nodes(self, tag):
+        """ The result of //tag/node(), or None when an element is nested
+        within another of the same tag, as their nodes would interleave
+        """
+        if self._buckets is None:
+            self._build()
+
+        elements = self._buckets.get(tag, ())
+        for element in elements[1:]:
+            if next(element.iterancestors(tag), None) is not None:
+                return None
+
+        nodes = []
+        for element in elements:
+            if element.text is not None:
+                nodes.append(element.text)
+            for child in element:
+                nodes.append(child)
+                if child.tail is not None:
+                    nodes.append(child.tail)
+        return nodes
+
+
+def _evaluate_tag_nodes(tag, xpath, doc):
+    index = getattr(_current, 'index', None)
+    nodes = index.nodes(tag) if index is not None and index.doc is doc else None
+    return _format_xpath_result(xpath(doc) if nodes is None else nodes)
+
+
+def _same(cached, current):
+    return cached is current or cached == current
+
+
+def _call_with(fn, args, kwargs, doc):
+    return fn(*[arg(doc) for arg in args], **{k: v(doc) for k, v in kwargs})
+
+
+def _evaluate_then_none(steps, doc):
+    for step in steps:
+        step(doc)
+
+
+def _format_xpath_result(val):
+    return '' if not val else unicode(val[0]) if len(val) == 1 else [unicode(v) for v in val]
+
+
+def _evaluate_xpath(xpath, doc):
+    return _format_xpath_result(xpath(doc))
@@ -0,0 +1,224 @@
+"""Local caches that sit in front of Cassandra
+    MemoryCache is an in-process LRU, DiskCache is an sqlite file shared by
+    every worker process on a host. Both are bounded in bytes and evict by size and by age.
+"""
+from __future__ import absolute_import
+
+import os
+import time
+import pickle
+import socket
+import sqlite3
+import threading
+from collections import OrderedDict
+
+from scrapi import settings
+
+
+def byte_size(value):
+    """The number of bytes held in the strings of value, which is close enough for response bodies"""
+    if isinstance(value, basestring):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(byte_size(item) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(byte_size(item) for item in value)
+    return 0
+
+
+class MemoryCache(object):
+    """A thread safe least recently used cache whose entries expire after ttl seconds
+    Holds at most maxbytes, as measured by sizeof. Values larger than max_entry are not cached
+    """
+
+    def __init__(self, maxbytes, ttl, max_entry=None, sizeof=byte_size):
+        self.ttl = ttl
+        self.sizeof = sizeof
+        self.maxbytes = maxbytes
+        self.max_entry = max_entry
+        self.size = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def _pop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry[2]
+        return entry
+
+    def get(self, key):
+        with self._lock:
+            entry = self._pop(key)
+            if entry is None:
+                return None
+
+            stored, value, size = entry
+            if time.time() - stored > self.ttl:
+                return None
+
+            self._entries[key] = entry
+            self.size += size
+            return value
+
+    def set(self, key, value):
+        size = self.sizeof(value)
+        with self._lock:
+            self._pop(key)
+            if size > min(self.max_entry or self.maxbytes, self.maxbytes):
+                return
+
+            self._entries[key] = (time.time(), value, size)
+            self.size += size
+            while self.size > self.maxbytes:
+                self._pop(next(iter(self._entries)))
+
+    def delete(self, key):
+        with self._lock:
+            self._pop(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+
+class DiskCache(object):
+    """An sqlite backed least recently used cache whose entries expire after ttl seconds
+    Holds roughly maxbytes of pickled values, as measured by sizeof, evicting every EVICT_EVERY writes
+    Connections are per thread and per process, the file itself is shared
+    """
+    EVICT_EVERY = 100
+
+    def __init__(self, path, maxbytes, ttl, sizeof=len):
+        self.ttl = ttl
+        self.path = path
+        self.sizeof = sizeof
+        self.maxbytes = maxbytes
+        self._local = threading.local()
+        self._writes = 0
+
+    @property
+    def _db(self):
+        if getattr(self._local, 'pid', None) != os.getpid():
+            self._local.pid = os.getpid()
+            self._local.db = sqlite3.connect(self.path, timeout=30)
+            self._local.db.execute(
+                'CREATE TABLE IF NOT EXISTS cache '
+                '(key TEXT PRIMARY KEY, value BLOB, stored REAL, accessed REAL, size INTEGER DEFAULT 0)'
+            )
+            try:
+                # Caches created before entries were sized
+                self._local.db.execute('ALTER TABLE cache ADD COLUMN size INTEGER DEFAULT 0')
+            except sqlite3.OperationalError:
+                pass
+            self._local.db.execute('CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)')
+        return self._local.db
+
+    def get(self, key):
+        now = time.time()
+        with self._db as db:
+            row = db.execute('SELECT value, stored FROM cache WHERE key = ?', (key, )).fetchone()
+            if row is None:
+                return None
+
+            if now - row[1] > self.ttl:
+                db.execute('DELETE FROM cache WHERE key = ?', (key, ))
+                return None
+
+            db.execute('UPDATE cache SET accessed = ? WHERE key = ?', (now, key))
+        return pickle.loads(str(row[0]))
+
+    def set(self, key, value):
+        now = time.time()
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        size = self.sizeof(data)
+        if size > self.maxbytes:
+            self.delete(key)
+            return
+
+        with self._db as db:
+            db.execute(
+                'INSERT OR REPLACE INTO cache (key, value, stored, accessed, size) VALUES (?, ?, ?, ?, ?)',
+                (key, sqlite3.Binary(data), now, now, size)
+            )
+
+        self._writes += 1
+        if self._writes % self.EVICT_EVERY == 0:
+            self.evict()
+
+    def delete(self, key):
+        with self._db as db:
+            db.execute('DELETE FROM cache WHERE key = ?', (key, ))
+
+    def evict(self):
+        with self._db as db:
+            db.execute('DELETE FROM cache WHERE stored < ?', (time.time() - self.ttl, ))
+
+            excess = (db.execute('SELECT SUM(size) FROM cache').fetchone()[0] or 0) - self.maxbytes
+            if excess <= 0:
+                return
+
+            evicted = []
+            for key, size in db.execute('SELECT key, size FROM cache ORDER BY accessed'):
+                evicted.append((key, ))
+                excess -= size
+                if excess <= 0:
+                    break
+            db.executemany('DELETE FROM cache WHERE key = ?', evicted)
+
+    def clear(self):
+        with self._db as db:
+            db.execute('DELETE FROM cache')
+
+
+class TieredCache(object):
+    """Looks through each cache in turn, filling in the faster ones on a hit
+    """
+
+    def __init__(self, *tiers):
+        self.tiers = tiers
+
+    def get(self, key):
+        for i, tier in enumerate(self.tiers):
+            value = tier.get(key)
+            if value is not None:
+                for faster in self.tiers[:i]:
+                    faster.set(key, value)
+                return value
+        return None
+
+    def set(self, key, value):
+        for tier in self.tiers:
+            tier.set(key, value)
+
+    def delete(self, key):
+        for tier in self.tiers:
+            tier.delete(key)
+
+    def clear(self):
+        for tier in self.tiers:
+            tier.clear()
+
+
+_responses = None
+
+
+def responses():
+    """The cache of recorded responses, built from settings on first use
+    """
+    global _responses
+
+    if _responses is None:
+        tiers = [MemoryCache(
+            settings.RESPONSE_CACHE_BYTES,
+            settings.RESPONSE_CACHE_TTL,
+            max_entry=settings.RESPONSE_CACHE_MAX_ENTRY
+        )]
+
+        if settings.RESPONSE_DISK_CACHE:
+            path = os.path.join(settings.RESPONSE_DISK_CACHE, '{}.sqlite'.format(socket.gethostname()))
+            tiers.append(DiskCache(path, settings.RESPONSE_DISK_CACHE_BYTES, settings.RESPONSE_DISK_CACHE_TTL))
+
+        _responses = TieredCache(*tiers)
+
+    return _responses
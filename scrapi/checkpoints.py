@@ -0,0 +1,80 @@
+"""Progress checkpoints for long running, resumable harvests
+    Stores the resumptionToken of the last page that was handed off
+    so that a rerun of the same window can pick up where it left off
+"""
+from __future__ import absolute_import
+
+import logging
+from datetime import datetime
+
+import pytz
+import cqlengine
+from cqlengine import columns
+from dateutil.parser import parse
+
+from scrapi import database
+
+logger = logging.getLogger(__name__)
+logging.getLogger('cqlengine.cql').setLevel(logging.WARN)
+
+
+@database.register_model
+class HarvestCheckpoint(cqlengine.Model):
+    """The progress of the current run of a harvester
+    Keyed on the harvester as only one run of a window is resumed at a time
+    """
+    __table_name__ = 'harvest_checkpoints'
+
+    harvester = columns.Text(primary_key=True)
+
+    from_date = columns.Text()
+    page_count = columns.Integer(default=0)
+    resumption_token = columns.Text()
+    expires = columns.DateTime()
+    updated = columns.DateTime(default=datetime.utcnow)
+
+    @property
+    def expired(self):
+        return self.expires is not None and self.expires < datetime.utcnow()
+
+
+def load(harvester, from_date):
+    """Get the checkpoint for the given harvester if it can still be resumed
+    Checkpoints from a different window or with an expired token are discarded
+    """
+    try:
+        checkpoint = HarvestCheckpoint.get(harvester=harvester)
+    except HarvestCheckpoint.DoesNotExist:
+        return None
+
+    if checkpoint.from_date != from_date:
+        logger.info('Discarding checkpoint for "{}" from another window ({})'.format(harvester, checkpoint.from_date))
+        return None
+
+    if checkpoint.expired:
+        logger.warning('ResumptionToken for "{}" expired at {}, restarting harvest'.format(harvester, checkpoint.expires))
+        return None
+
+    return checkpoint
+
+
+def commit(harvester, from_date, token, page_count, expires=None):
+    return HarvestCheckpoint(
+        harvester=harvester,
+        from_date=from_date,
+        page_count=page_count,
+        resumption_token=token,
+        expires=_to_utc(expires) if expires else None,
+        updated=datetime.utcnow()
+    ).save()
+
+
+def _to_utc(stamp):
+    stamp = parse(stamp)
+    if stamp.tzinfo:
+        stamp = stamp.astimezone(pytz.utc).replace(tzinfo=None)
+    return stamp
+
+
+def clear(harvester):
+    HarvestCheckpoint.objects(harvester=harvester).delete()
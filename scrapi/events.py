@@ -20,6 +20,8 @@ if not settings.USE_FLUENTD:
 # Events
 PROCESSING = 'processing'
 HARVESTER_RUN = 'runHarvester'
+HARVEST_FILTER = 'harvestFilter'
+HTTP_METRICS = 'httpMetrics'
 CHECK_ARCHIVE = 'checkArchive'
 NORMALIZATION = 'normalization'
 
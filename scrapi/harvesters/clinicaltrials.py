@@ -5,7 +5,6 @@ API harvester for ClinicalTrials.gov for the SHARE Notification Service
 #!/usr/bin/env python
 from __future__ import unicode_literals
 
-import time
 import logging
 import datetime
 
@@ -17,6 +16,7 @@ from scrapi import requests
 from scrapi.base import XMLHarvester
 from scrapi.linter.document import RawDocument
 from scrapi.base.schemas import default_name_parser
+from scrapi.base.helpers import parsed_in_process
 
 logger = logging.getLogger(__name__)
 
@@ -118,25 +118,21 @@ class ClinicalTrialsHarvester(XMLHarvester):
         if int(count) > 0:
             # get a new url with all results in it
             url = url + '&count=' + str(count)
-            total_requests = requests.get(url)
-            initial_doc = etree.XML(total_requests.content)
+            total_requests = requests.get(url, stream=True)
 
-            # make a list of urls from that full list of studies
+            # make a list of urls from that full list of studies, parsing it as it arrives
             study_urls = []
-            for study in initial_doc.xpath('//clinical_study'):
+            for _, study in etree.iterparse(total_requests.raw, events=('end', ), tag='clinical_study'):
                 study_urls.append(study.xpath('url/node()')[0] + '?displayxml=true')
+                # Drop the study from the tree too, or the root keeps every emptied element
+                study.clear()
+                study.getparent().remove(study)
 
             # grab each of those urls for full content
             logger.info("There are {} urls to harvest - be patient...".format(len(study_urls)))
             count = 0
             official_count = 0
-            for study_url in study_urls:
-                try:
-                    content = requests.get(study_url)
-                except requests.exceptions.ConnectionError as e:
-                    logger.info('Connection error: {}, wait a bit...'.format(e))
-                    time.sleep(30)
-                    continue
+            for study_url, content in requests.fetch_all(study_urls):
                 doc = etree.XML(content.content)
                 record = etree.tostring(doc, encoding=record_encoding)
                 doc_id = doc.xpath('//nct_id/node()')[0]
@@ -145,7 +141,7 @@ class ClinicalTrialsHarvester(XMLHarvester):
                     'source': self.short_name,
                     'docID': self.copy_to_unicode(doc_id),
                     'filetype': 'xml',
-                }))
+                }, parsed=parsed_in_process(doc, copy=False)))
                 official_count += 1
                 count += 1
                 if count % 100 == 0:
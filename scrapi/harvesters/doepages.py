@@ -7,7 +7,7 @@ from lxml import etree
 from scrapi import requests
 from scrapi.base import XMLHarvester
 from scrapi.linter import RawDocument
-from scrapi.base.helpers import updated_schema
+from scrapi.base.helpers import updated_schema, parsed_in_process
 from scrapi.base.schemas import BASEXMLSCHEMA
 
 
@@ -16,6 +16,40 @@ class DoepagesHarvester(XMLHarvester):
     long_name = 'Department of Energy Pages'
     url = 'http://www.osti.gov/pages/'
 
+    namespaces = {
+        'rdf': 'http://www.w3.org/1999/02/22-rdf-syntax-ns#',
+        'dc': 'http://purl.org/dc/elements/1.1/',
+        'dcq': 'http://purl.org/dc/terms/'
+    }
+    schema = updated_schema(
+        BASEXMLSCHEMA,
+        {
+            'properties': {
+                'language': '//dc:language/node()',
+                'type': '//dc:type/node()',
+                'typeQualifier': '//dc:typeQualifier/node()',
+                'language': '//dc:language/node()',
+                'format': '//dc:format/node()',
+                'identifierOther': '//dc:identifierOther/node()',
+                'rights': '//dc:rights/node()',
+                'identifierDOEcontract': '//dcq:identifierDOEcontract/node()',
+                'relation': '//dc:relation/node()',
+                'coverage': '//dc:coverage/node()',
+                'identifier-purl': '//dc:identifier-purl/node()',
+                'identifier': '//dc:identifier/node()',
+                'identifierReport': '//dc:identifierReport/node()',
+                'publisherInfo': {
+                    'publisher': '//dcq:publisher/node()',
+                    'publisherCountry': '//dcq:publisherCountry/node()',
+                    'publisherSponsor': '//dcq:publisherSponsor/node()',
+                    'publisherAvailability': '//dcq:publisherAvailability/node()',
+                    'publisherResearch': '//dcq:publisherResearch/node()',
+                    'date': '//dc:date/node()'
+                }
+            }
+        }
+    )
+
     def harvest(self, days_back=1):
         start_date = date.today() - timedelta(days_back)
         base_url = 'http://www.osti.gov/pages/pagesxml?nrows={0}&EntryDateFrom={1}'
@@ -35,13 +69,12 @@ class DoepagesHarvester(XMLHarvester):
         xml_list = []
         for record in records:
             doc_id = record.xpath('dc:ostiId/node()', namespaces=self.namespaces)[0]
-            record = etree.tostring(record, encoding=record_encoding)
             xml_list.append(RawDocument({
-                'doc': record,
+                'doc': etree.tostring(record, encoding=record_encoding),
                 'source': self.short_name,
                 'docID': self.copy_to_unicode(doc_id),
                 'filetype': 'xml'
-            }))
+            }, parsed=parsed_in_process(record)))
 
         return xml_list
 
@@ -51,42 +84,3 @@ class DoepagesHarvester(XMLHarvester):
             return element
         else:
             return unicode(element, encoding=encoding)
-
-    @property
-    def namespaces(self):
-        return {
-            'rdf': 'http://www.w3.org/1999/02/22-rdf-syntax-ns#',
-            'dc': 'http://purl.org/dc/elements/1.1/',
-            'dcq': 'http://purl.org/dc/terms/'
-        }
-
-    @property
-    def schema(self):
-        return updated_schema(
-            BASEXMLSCHEMA,
-            {
-                'properties': {
-                    'language': '//dc:language/node()',
-                    'type': '//dc:type/node()',
-                    'typeQualifier': '//dc:typeQualifier/node()',
-                    'language': '//dc:language/node()',
-                    'format': '//dc:format/node()',
-                    'identifierOther': '//dc:identifierOther/node()',
-                    'rights': '//dc:rights/node()',
-                    'identifierDOEcontract': '//dcq:identifierDOEcontract/node()',
-                    'relation': '//dc:relation/node()',
-                    'coverage': '//dc:coverage/node()',
-                    'identifier-purl': '//dc:identifier-purl/node()',
-                    'identifier': '//dc:identifier/node()',
-                    'identifierReport': '//dc:identifierReport/node()',
-                    'publisherInfo': {
-                        'publisher': '//dcq:publisher/node()',
-                        'publisherCountry': '//dcq:publisherCountry/node()',
-                        'publisherSponsor': '//dcq:publisherSponsor/node()',
-                        'publisherAvailability': '//dcq:publisherAvailability/node()',
-                        'publisherResearch': '//dcq:publisherResearch/node()',
-                        'date': '//dc:date/node()'
-                    }
-                }
-            }
-        )
@@ -18,6 +18,7 @@ class MITHarvester(OAIHarvester):
     url = 'http://dspace.mit.edu/'
 
     base_url = 'http://dspace.mit.edu/oai/request'
+    harvest_by_set = True
     property_list = [
         'type', 'source', 'publisher',
         'format', 'rights', 'identifier',
@@ -17,7 +17,7 @@ from scrapi import requests
 
 from scrapi.base import XMLHarvester
 from scrapi.linter import RawDocument
-from scrapi.base.helpers import updated_schema
+from scrapi.base.helpers import updated_schema, parsed_in_process
 from scrapi.base.schemas import BASEXMLSCHEMA
 
 NAME = 'scitech'
@@ -78,7 +78,7 @@ class SciTechHarvester(XMLHarvester):
                 'filetype': self.file_format,
                 'doc': etree.tostring(record),
                 'docID': record.xpath('dc:ostiId/node()', namespaces=self.namespaces)[0].decode('utf-8'),
-            })
+            }, parsed=parsed_in_process(record))
             for record in self._fetch_records(days_back)
         ]
 
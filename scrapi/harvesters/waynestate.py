@@ -17,6 +17,8 @@ class WayneStateHarvester(OAIHarvester):
     url = 'http://digitalcommons.wayne.edu'
 
     base_url = 'http://digitalcommons.wayne.edu/do/oai/'
+    harvest_by_set = True
+    set_spec_prefix = 'publication:'
     property_list = [
         'type', 'source', 'publisher', 'format',
         'date', 'setSpec', 'identifier'
@@ -42,6 +42,20 @@ class RawDocument(BaseDocument):
         'filetype': unicode
     }
 
+    # The already parsed doc, if any. It is not pickled, so it only
+    # survives as long as the document stays in the same process
+    parsed = None
+
+    def __init__(self, attributes, parsed=None):
+        super(RawDocument, self).__init__(attributes)
+
+        self.parsed = parsed
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop('parsed', None)
+        return state
+
 
 class NormalizedDocument(BaseDocument):
     CONTRIBUTOR_FIELD = {
@@ -0,0 +1,186 @@
+"""Per host and per harvester instrumentation of outgoing requests
+    Latency, bytes, status codes, recorded response hits and time spent throttled
+    are collected by scrapi.requests when HTTP_METRICS is set. Every hook returns
+    straight away when it is not.
+
+    Requests are attributed to the harvester set by the harvesting context manager,
+    which is per thread; use bind to carry it into worker threads.
+"""
+from __future__ import absolute_import
+
+import threading
+from functools import wraps
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+import furl
+from celery.signals import worker_process_init
+
+from scrapi import events
+from scrapi import settings
+
+# Upper bounds, in seconds, of the latency and throttle histogram buckets
+BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, float('inf'))
+
+
+class Histogram(object):
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def stats(self):
+        return {
+            'count': self.count,
+            'total': self.total,
+            'max': self.max,
+            'mean': self.total / self.count if self.count else 0,
+            'buckets': [
+                [bound, count]
+                for bound, count in zip(self.buckets, self.counts)
+            ],
+        }
+
+
+class RequestStats(object):
+
+    def __init__(self):
+        self.bytes = 0
+        self.requests = 0
+        self.latency = Histogram()
+        self.throttle = Histogram()
+        self.statuses = Counter()
+        self.recorded = Counter()
+
+    def stats(self):
+        return {
+            'bytes': self.bytes,
+            'requests': self.requests,
+            'latency': self.latency.stats(),
+            'throttle': self.throttle.stats(),
+            'statuses': {str(code): count for code, count in self.statuses.items()},
+            'recorded': dict(self.recorded),
+        }
+
+
+class Metrics(object):
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self, *args, **kwargs):
+        self._lock = threading.Lock()
+        self._hosts = defaultdict(RequestStats)
+        self._harvesters = defaultdict(lambda: defaultdict(RequestStats))
+
+    def _targets(self, url):
+        host = furl.furl(url).host
+        targets = [self._hosts[host]]
+        harvester = current_harvester()
+        if harvester:
+            targets.append(self._harvesters[harvester][host])
+        return targets
+
+    def request(self, url, status_code, elapsed, size):
+        with self._lock:
+            for target in self._targets(url):
+                target.requests += 1
+                target.bytes += size
+                target.latency.observe(elapsed)
+                target.statuses[status_code] += 1
+
+    def wait(self, url, wait):
+        with self._lock:
+            for target in self._targets(url):
+                target.throttle.observe(wait)
+
+    def recorded(self, url, outcome):
+        with self._lock:
+            for target in self._targets(url):
+                target.recorded[outcome] += 1
+
+    def stats(self, harvester=None):
+        with self._lock:
+            hosts = self._harvesters.get(harvester, {}) if harvester else self._hosts
+            return {host: stats.stats() for host, stats in hosts.items()}
+
+    def pop(self, harvester):
+        with self._lock:
+            hosts = self._harvesters.pop(harvester, {})
+            return {host: stats.stats() for host, stats in hosts.items()}
+
+
+_metrics = Metrics()
+_context = threading.local()
+
+worker_process_init.connect(_metrics.reset)
+
+
+def current_harvester():
+    return getattr(_context, 'harvester', None)
+
+
+@contextmanager
+def harvesting(harvester_name):
+    """Attribute requests made by this thread to harvester_name while in this block"""
+    previous, _context.harvester = current_harvester(), harvester_name
+    try:
+        yield
+    finally:
+        _context.harvester = previous
+
+
+def bind(func):
+    """Wrap func to run with the calling thread's harvester, for handing to worker threads"""
+    harvester = current_harvester()
+
+    @wraps(func)
+    def wrapped(*args, **kwargs):
+        with harvesting(harvester):
+            return func(*args, **kwargs)
+    return wrapped
+
+
+def record_request(url, response, elapsed, stream=False):
+    if not settings.HTTP_METRICS:
+        return
+    if stream:
+        size = int(response.headers.get('Content-Length') or 0)
+    else:
+        size = len(response.content or b'')
+    _metrics.request(url, response.status_code, elapsed, size)
+
+
+def record_wait(url, wait):
+    if settings.HTTP_METRICS:
+        _metrics.wait(url, wait)
+
+
+def record_recorded(url, outcome):
+    """Count what became of a recorded response: hit, miss or notModified"""
+    if settings.HTTP_METRICS:
+        _metrics.recorded(url, outcome)
+
+
+def stats(harvester=None):
+    """The stats of every host, or of every host harvester made requests to"""
+    return _metrics.stats(harvester)
+
+
+def emit(harvester):
+    """Dispatch and clear the stats collected for harvester"""
+    if not settings.HTTP_METRICS:
+        return
+    events.dispatch(events.HTTP_METRICS, events.COMPLETED, harvester=harvester, hosts=_metrics.pop(harvester))
@@ -0,0 +1,150 @@
+"""Adaptive, per host rate limiting for outgoing requests
+    A token bucket is kept for every host and shared by all threads in the process.
+    Buckets start at the interval requested by the harvester (its throttle),
+    speed up while the host answers quickly and back off on 429/503 and Retry-After
+"""
+from __future__ import absolute_import
+
+import time
+import logging
+import threading
+from email.utils import parsedate_tz, mktime_tz
+
+import furl
+from celery.signals import worker_process_init
+
+from scrapi import settings
+
+logger = logging.getLogger(__name__)
+
+SPEEDUP = 0.9
+BACKOFF = 2
+MIN_BACKOFF = 1
+MAX_INTERVAL = 600
+BACKOFF_CODES = (429, 503)
+
+
+def parse_retry_after(value):
+    """Retry-After may be a number of seconds or an HTTP date"""
+    if not value:
+        return None
+    try:
+        return max(0, float(value))
+    except ValueError:
+        parsed = parsedate_tz(value)
+        return max(0, mktime_tz(parsed) - time.time()) if parsed else None
+
+
+class TokenBucket(object):
+
+    def __init__(self, interval, burst=1):
+        self.burst = burst
+        self.interval = interval
+        self.base_interval = interval
+
+        self.tokens = burst
+        self.blocked_until = 0
+        self.updated = time.time()
+
+        self.requests = 0
+        self.backoffs = 0
+        self.max_wait = 0
+        self.total_wait = 0
+
+    def reserve(self, now):
+        """Take a token, returning the number of seconds to wait before using it
+        Tokens may go negative, which queues up concurrent callers behind each other
+        """
+        if self.interval:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) / self.interval)
+        else:
+            self.tokens = self.burst
+
+        self.updated = now
+        self.tokens -= 1
+
+        wait = max(0, -self.tokens * self.interval, self.blocked_until - now)
+
+        self.requests += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+
+        return wait
+
+    def feedback(self, now, status_code, elapsed, retry_after=None):
+        if status_code in BACKOFF_CODES or retry_after:
+            self.backoffs += 1
+            self.interval = min(MAX_INTERVAL, max(self.interval * BACKOFF, MIN_BACKOFF, retry_after or 0))
+            self.blocked_until = max(self.blocked_until, now + (retry_after or self.interval))
+        elif self.interval > self.base_interval:
+            # Recover from a back off, however slowly the host answers
+            self.interval = max(self.base_interval, self.interval * SPEEDUP)
+        elif elapsed < settings.RATE_LIMIT_FAST_RESPONSE:
+            self.interval = max(self.base_interval * settings.RATE_LIMIT_MIN_RATIO, self.interval * SPEEDUP)
+        else:
+            self.interval = min(self.base_interval, self.interval / SPEEDUP)
+
+    def stats(self):
+        return {
+            'requests': self.requests,
+            'backoffs': self.backoffs,
+            'interval': self.interval,
+            'maxWait': self.max_wait,
+            'totalWait': self.total_wait,
+            'meanWait': self.total_wait / self.requests if self.requests else 0,
+        }
+
+
+class RateLimiter(object):
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self, *args, **kwargs):
+        self._lock = threading.Lock()
+        self._buckets = {}
+
+    def _bucket(self, host, interval):
+        bucket = self._buckets.get(host)
+
+        if bucket is None:
+            bucket = self._buckets[host] = TokenBucket(interval, burst=settings.RATE_LIMIT_BURST)
+        elif interval > bucket.base_interval:
+            # Callers may ask for different throttles, honor the slowest without losing a back off in progress
+            bucket.base_interval = interval
+
+        return bucket
+
+    def reserve(self, url, interval=0):
+        """Reserve a slot for a request to url, returning the time to wait for it
+        :param float interval: The minimum time between requests asked for by the caller
+        """
+        host = furl.furl(url).host
+        with self._lock:
+            return self._bucket(host, interval or 0).reserve(time.time())
+
+    def feedback(self, url, response, elapsed):
+        """Adjust the rate for url's host based on a response
+        Returns the Retry-After given by the host, if any
+        """
+        retry_after = None
+        if response.status_code in BACKOFF_CODES:
+            retry_after = parse_retry_after(response.headers.get('Retry-After'))
+            logger.warning('Backing off "{}" after a {} response'.format(url, response.status_code))
+
+        host = furl.furl(url).host
+        with self._lock:
+            bucket = self._buckets.get(host)
+            if bucket:
+                bucket.feedback(time.time(), response.status_code, elapsed, retry_after=retry_after)
+
+        return retry_after
+
+    def stats(self):
+        with self._lock:
+            return {host: bucket.stats() for host, bucket in self._buckets.items()}
+
+
+limiter = RateLimiter()
+
+worker_process_init.connect(limiter.reset)
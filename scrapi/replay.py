@@ -0,0 +1,123 @@
+"""File based recording of HTTP transactions, for replaying harvests without Cassandra
+    An archive is a directory holding an append-only file of zlib compressed
+    responses and an index of where each one starts. Later entries for the
+    same request replace earlier ones. Archives are written by a single process.
+
+    Use REPLAY_ARCHIVE or the archive context manager to turn recording into an archive on.
+"""
+from __future__ import absolute_import
+
+import os
+import json
+import zlib
+import pickle
+import logging
+import threading
+from contextlib import contextmanager
+
+from requests import exceptions
+
+from scrapi import settings
+
+logger = logging.getLogger(__name__)
+
+
+class ReplayMiss(exceptions.ConnectionError):
+    """Raised for requests that are not in an offline archive"""
+
+
+class ReplayArchive(object):
+    DATA = 'responses.dat'
+    INDEX = 'responses.idx'
+
+    def __init__(self, path, offline=False):
+        self.path = path
+        self.offline = offline
+        self._lock = threading.Lock()
+
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+        self._data = open(os.path.join(path, self.DATA), 'a+b')
+        self._data.seek(0, os.SEEK_END)
+        self._index = self._load_index(self._data.tell())
+        self._index_file = open(os.path.join(path, self.INDEX), 'a')
+
+    def _load_index(self, size):
+        index = {}
+        try:
+            with open(os.path.join(self.path, self.INDEX)) as index_file:
+                for line in index_file:
+                    try:
+                        key, offset, length = json.loads(line)
+                    except ValueError:
+                        continue
+                    # Entries past the end of the data were never fully written
+                    if offset + length <= size:
+                        index[key] = (offset, length)
+        except IOError:
+            pass
+        return index
+
+    def __contains__(self, key):
+        return key in self._index
+
+    def __len__(self):
+        return len(self._index)
+
+    def get(self, key):
+        with self._lock:
+            location = self._index.get(key)
+            if location is None:
+                return None
+            self._data.seek(location[0])
+            data = self._data.read(location[1])
+        return pickle.loads(zlib.decompress(data))
+
+    def put(self, key, values):
+        data = zlib.compress(pickle.dumps(values, pickle.HIGHEST_PROTOCOL))
+        with self._lock:
+            self._data.seek(0, os.SEEK_END)
+            offset = self._data.tell()
+            self._data.write(data)
+            self._data.flush()
+
+            self._index[key] = (offset, len(data))
+            self._index_file.write(json.dumps([key, offset, len(data)]) + '\n')
+            self._index_file.flush()
+
+    def close(self):
+        with self._lock:
+            self._data.close()
+            self._index_file.close()
+
+
+_active = None
+
+
+def active():
+    """The archive requests are recorded to and replayed from, if there is one"""
+    global _active
+
+    if _active is None and settings.REPLAY_ARCHIVE:
+        logger.info('Replaying requests from "{}"'.format(settings.REPLAY_ARCHIVE))
+        _active = ReplayArchive(settings.REPLAY_ARCHIVE, offline=settings.REPLAY_OFFLINE)
+
+    return _active
+
+
+@contextmanager
+def archive(path, offline=False):
+    """Record requests to and replay them from the archive at path while in this block
+
+    :param str path: The directory of the archive, created if needed
+    :param bool offline: Raise ReplayMiss rather than making requests that are not in the archive
+    """
+    global _active
+
+    previous, _active = _active, ReplayArchive(path, offline=offline)
+    try:
+        yield _active
+    finally:
+        _active.close()
+        _active = previous
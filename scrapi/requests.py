@@ -4,45 +4,169 @@
 """
 from __future__ import absolute_import
 
+import os
 import json
 import time
+import zlib
+import hashlib
 import logging
 import functools
-from datetime import datetime
+import threading
+from datetime import date, datetime, timedelta
+from multiprocessing.pool import ThreadPool
 
 import furl
 import requests
 import cqlengine
 from cqlengine import columns
+from requests import exceptions
 from requests.structures import CaseInsensitiveDict
 
+from scrapi import cache
+from scrapi import replay
 from scrapi import events
+from scrapi import metrics
 from scrapi import database
 from scrapi import settings
+from scrapi import ratelimit
 
 logger = logging.getLogger(__name__)
 logging.getLogger('cqlengine.cql').setLevel(logging.WARN)
 
 
+# Codecs a recorded body may be stored with, keyed by the value of HarvesterResponse.codec
+CODECS = {
+    'zlib': (zlib.compress, zlib.decompress),
+}
+
+
+def _url_partition(url):
+    """The host and url hash that a recorded response for url is partitioned on"""
+    if isinstance(url, unicode):
+        url = url.encode('utf-8')
+    return furl.furl(url).host or '', hashlib.sha1(url).hexdigest()
+
+
 @database.register_model
 class HarvesterResponse(cqlengine.Model):
     """A parody of requests.response but stored in cassandra
     Should reflect all methods of a response object
     Contains an additional field time_made, self-explanitory
+    Partitioned on host and a hash of the url, both are filled in from url
+    Bodies are stored compressed with codec and decompressed on first access
+    Streamed bodies are stored as HarvesterResponseChunks instead, chunks is their count
     """
-    __table_name__ = 'responses'
+    __table_name__ = 'harvester_responses'
+    __compaction__ = cqlengine.LeveledCompactionStrategy
+    __default_time_to_live__ = settings.RECORDED_RESPONSE_TTL
+    __gc_grace_seconds__ = settings.RECORDED_RESPONSE_GC_GRACE
 
+    host = columns.Text(partition_key=True)
+    url_hash = columns.Text(partition_key=True)
     method = columns.Text(primary_key=True)
     url = columns.Text(primary_key=True, required=True)
 
     # Raw request data
     ok = columns.Boolean()
-    content = columns.Bytes()
+    codec = columns.Text()
+    body = columns.Bytes(db_field='content')
+    chunks = columns.Integer()
     encoding = columns.Text()
     headers_str = columns.Text()
     status_code = columns.Integer()
     time_made = columns.DateTime(default=datetime.now)
 
+    def __init__(self, **values):
+        if values.get('url') is not None and not (values.get('host') is not None and values.get('url_hash')):
+            values['host'], values['url_hash'] = _url_partition(values['url'])
+        if 'content' in values:
+            values.update(self._encode(values.pop('content')))
+        super(HarvesterResponse, self).__init__(**values)
+
+    @classmethod
+    def get(cls, *args, **kwargs):
+        if kwargs.get('url') is not None and 'url_hash' not in kwargs:
+            kwargs['host'], kwargs['url_hash'] = _url_partition(kwargs['url'])
+        return super(HarvesterResponse, cls).get(*args, **kwargs)
+
+    @staticmethod
+    def _encode(content):
+        codec = settings.RESPONSE_CODEC
+        if content is None or not codec:
+            return {'body': content, 'codec': None}
+        return {'body': CODECS[codec][0](content), 'codec': codec}
+
+    def update(self, **values):
+        if 'content' in values:
+            values.update(self._encode(values.pop('content')))
+        return super(HarvesterResponse, self).update(**values)
+
+    @property
+    def content(self):
+        if getattr(self, '_recording', None) is not None:
+            content = b''.join(self.iter_chunks())
+            self._decoded = (self.body, self.chunks, content)
+
+        decoded = getattr(self, '_decoded', None)
+        if decoded is None or decoded[0] is not self.body or decoded[1] != self.chunks:
+            if self.chunks:
+                content = b''.join(self.iter_chunks())
+            else:
+                content = self.body
+                if content is not None and self.codec:
+                    content = CODECS[self.codec][1](content)
+            decoded = self._decoded = (self.body, self.chunks, content)
+        return decoded[2]
+
+    @content.setter
+    def content(self, content):
+        encoded = self._encode(content)
+        self.body, self.codec = encoded['body'], encoded['codec']
+
+    def iter_chunks(self):
+        """Yield the body a stored chunk at a time, fetching chunks a page at a time
+        A body that is still being recorded is yielded as it downloads instead
+        """
+        recording, self._recording = getattr(self, '_recording', None), None
+        if recording is not None:
+            for data in recording:
+                yield data
+            return
+
+        if not self.chunks:
+            if self.content:
+                yield self.content
+            return
+
+        decode = CODECS[self.codec][1] if self.codec else None
+
+        cached = cache.responses().get(_chunks_key(self))
+        if cached is not None and len(cached) == self.chunks:
+            for data in cached:
+                yield decode(data) if decode else data
+            return
+
+        index = 0
+        while index < self.chunks:
+            page = list(HarvesterResponseChunk.objects(
+                host=self.host,
+                url_hash=self.url_hash,
+                method=self.method,
+                url=self.url,
+            ).filter(index__gte=index, index__lt=self.chunks).limit(settings.RESPONSE_CHUNK_PAGE))
+
+            if not page:
+                raise IOError('Missing chunk {} of {} for "{}"'.format(index, self.chunks, self.url))
+
+            for chunk in page:
+                yield decode(chunk.data) if decode else chunk.data
+            index = page[-1].index + 1
+
+    @property
+    def raw(self):
+        """The body as a file like object, streamed from storage when it was recorded in chunks"""
+        return ChunkedReader(self.iter_chunks())
+
     def json(self):
         return json.loads(self.content)
 
@@ -55,72 +179,611 @@ class HarvesterResponse(cqlengine.Model):
         return self.content.decode('utf-8')
 
 
-def _maybe_load_response(method, url):
+@database.register_model
+class HarvesterResponseChunk(cqlengine.Model):
+    """A piece of a streamed HarvesterResponse body, encoded with the response's codec"""
+    __table_name__ = 'harvester_response_chunks'
+    __compaction__ = cqlengine.LeveledCompactionStrategy
+    __default_time_to_live__ = settings.RECORDED_RESPONSE_TTL
+    __gc_grace_seconds__ = settings.RECORDED_RESPONSE_GC_GRACE
+
+    host = columns.Text(partition_key=True)
+    url_hash = columns.Text(partition_key=True)
+    method = columns.Text(primary_key=True)
+    url = columns.Text(primary_key=True)
+    index = columns.Integer(primary_key=True)
+
+    data = columns.Bytes()
+
+
+class ChunkedReader(object):
+    """A read only file over an iterable of byte strings"""
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._buffer = b''
+
+    def read(self, size=-1):
+        while size is None or size < 0 or len(self._buffer) < size:
+            try:
+                self._buffer += next(self._chunks)
+            except StopIteration:
+                break
+
+        if size is None or size < 0:
+            data, self._buffer = self._buffer, b''
+        else:
+            data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
+@database.register_model
+class RecordedResponseIndex(cqlengine.Model):
+    """Which responses each harvester recorded on a given day, for prefetching them in bulk"""
+    __table_name__ = 'harvester_response_index'
+    __default_time_to_live__ = settings.RECORDED_RESPONSE_TTL
+
+    harvester = columns.Text(partition_key=True)
+    day = columns.Text(partition_key=True)
+    method = columns.Text(primary_key=True)
+    url = columns.Text(primary_key=True)
+
+    host = columns.Text()
+    url_hash = columns.Text()
+
+
+@database.register_model
+class LegacyHarvesterResponse(cqlengine.Model):
+    """Recorded responses as they were stored before being partitioned by host
+    Every response with the same method lives in a single partition.
+    Only read from, see scripts/migrate_responses.py
+    """
+    __table_name__ = 'responses'
+
+    method = columns.Text(primary_key=True)
+    url = columns.Text(primary_key=True, required=True)
+
+    # Raw request data
+    ok = columns.Boolean()
+    content = columns.Bytes()
+    encoding = columns.Text()
+    headers_str = columns.Text()
+    status_code = columns.Integer()
+    time_made = columns.DateTime(default=datetime.now)
+
+
+def canonical_url(url):
+    """The url that requests for url are recorded under
+    Scheme and host are lowercased, default ports and fragments dropped,
+    an empty path becomes / and query parameters are sorted by name,
+    keeping the order of repeated parameters
+    """
+    parsed = furl.furl(url)
+    if not parsed.host:
+        return url
+
+    parsed.fragment.load('')
+    if not str(parsed.path):
+        parsed.path = '/'
+    parsed.query.load(sorted(parsed.args.allitems(), key=lambda item: item[0]))
+    return parsed.url
+
+
+def _cache_key(method, url):
+    return '{} {}'.format(method, url)
+
+
+def _chunks_key(resp):
+    # Keyed on when resp was recorded as well, so that chunks of an earlier recording are never read
+    return 'chunks {} {}'.format(_cache_key(resp.method, resp.url), resp.time_made and resp.time_made.isoformat())
+
+
+def _cache_response(resp):
+    cache.responses().set(_cache_key(resp.method, resp.url), dict(resp))
+    return resp
+
+
+def migrate_legacy_response(legacy):
+    """Copy a LegacyHarvesterResponse into the partitioned table, under its canonical url"""
+    values = {
+        name: getattr(legacy, name)
+        for name in LegacyHarvesterResponse._columns
+    }
+    values['url'] = canonical_url(legacy.url)
+    return HarvesterResponse(**values).save()
+
+
+def _rekey_response(resp, url):
+    """Copy a response recorded under an old key to url"""
+    if resp.chunks:
+        # Chunks are stored under the old key, leave them be
+        return resp
+
+    values = dict(resp)
+    values.update(url=url, host=None, url_hash=None)
+    logger.info('Moving recorded response from "{}" to "{}"'.format(resp.url, url))
+    return HarvesterResponse(**values).save()
+
+
+def _maybe_load_legacy_response(method, url):
+    try:
+        legacy = LegacyHarvesterResponse.get(url=url, method=method)
+    except LegacyHarvesterResponse.DoesNotExist:
+        return None
+    logger.info('Migrating recorded response from "{}"'.format(url))
+    return migrate_legacy_response(legacy)
+
+
+def _index_response(resp):
+    harvester = metrics.current_harvester()
+    if not (harvester and settings.INDEX_RECORDED_RESPONSES):
+        return
+
+    RecordedResponseIndex(
+        harvester=harvester,
+        day=(resp.time_made or datetime.now()).date().isoformat(),
+        method=resp.method,
+        url=resp.url,
+        host=resp.host,
+        url_hash=resp.url_hash,
+    ).save()
+
+
+def _save_response(resp, **values):
+    """Save resp with values applied to it, into the replay archive if one is active"""
+    archive = replay.active()
+
+    if archive is None:
+        if values:
+            resp = resp.update(**values)
+        resp = resp.save()
+        _index_response(resp)
+        return _cache_response(resp)
+
+    for name, value in values.items():
+        setattr(resp, name, value)
+    if resp.time_made is None:
+        resp.time_made = datetime.now()
+
+    archive.put(_cache_key(resp.method, resp.url), dict(resp))
+    return resp
+
+
+def _load_stored_response(method, url):
     try:
         return HarvesterResponse.get(url=url, method=method)
     except HarvesterResponse.DoesNotExist:
         return None
 
 
+def _maybe_load_response(method, url, original_url=None):
+    """Load the response recorded under url, falling back to original_url
+    which is where it was recorded before urls were canonicalized
+    """
+    fallback = original_url if original_url and original_url != url else None
+
+    archive = replay.active()
+    if archive is not None:
+        values = archive.get(_cache_key(method, url))
+        if values is None and fallback:
+            values = archive.get(_cache_key(method, fallback))
+        return HarvesterResponse._construct_instance(values) if values else None
+
+    cached = cache.responses().get(_cache_key(method, url))
+    if cached is not None:
+        return HarvesterResponse._construct_instance(cached)
+
+    resp = _load_stored_response(method, url)
+    if resp is None and fallback and settings.READ_UNCANONICAL_RESPONSES:
+        resp = _load_stored_response(method, fallback)
+        if resp is not None:
+            resp = _rekey_response(resp, url)
+
+    if resp is None and settings.READ_LEGACY_RESPONSES:
+        # The legacy table is keyed by the url as it was requested, rows are migrated to the canonical one
+        resp = _maybe_load_legacy_response(method, original_url or url)
+
+    return _cache_response(resp) if resp else None
+
+
+_sessions = {}
+_sessions_pid = None
+_sessions_lock = threading.Lock()
+
+
+def _session(url):
+    """A keep-alive session per scheme and host, shared by every thread
+    Sessions are thrown away whenever the process has been forked,
+    so celery workers never share connections with their parent
+    """
+    global _sessions_pid
+
+    parsed = furl.furl(url)
+    key = (parsed.scheme, parsed.host)
+
+    with _sessions_lock:
+        if _sessions_pid != os.getpid():
+            _sessions.clear()
+            _sessions_pid = os.getpid()
+
+        if key not in _sessions:
+            pool_size = settings.HTTP_POOL_SIZES.get(parsed.host, settings.HTTP_POOL_MAXSIZE)
+            adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+
+            session = requests.Session()
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _sessions[key] = session
+
+        return _sessions[key]
+
+
+def _send(method, url, throttle=None, **kwargs):
+    """Make a request through the per host rate limiter
+    Requests that the host asks us to back off from are retried
+    """
+    for attempt in range(settings.RATE_LIMIT_RETRIES + 1):
+        wait = ratelimit.limiter.reserve(url, throttle)
+        metrics.record_wait(url, wait)
+        if wait:
+            time.sleep(wait)
+
+        start = time.time()
+        response = _session(url).request(method, url, **kwargs)
+        elapsed = time.time() - start
+
+        ratelimit.limiter.feedback(url, response, elapsed)
+        metrics.record_request(url, response, elapsed, stream=kwargs.get('stream'))
+
+        if response.status_code not in ratelimit.BACKOFF_CODES:
+            break
+
+        if kwargs.get('stream'):
+            response.close()
+
+    if kwargs.get('stream'):
+        # Let raw readers see the body the same way iter_content would
+        response.raw.decode_content = True
+
+    return response
+
+
+def _record_chunks(resp, response):
+    """Record a streamed response body as it is read, yielding each piece of it as it arrives
+    Bodies of up to RESPONSE_CHUNK_SIZE bytes are kept back and stored inline, larger ones are
+    stored chunk by chunk. resp is saved once the body has been read to the end, it is not recorded otherwise
+    """
+    encode = CODECS[settings.RESPONSE_CODEC][0] if settings.RESPONSE_CODEC else None
+
+    def save_chunk(index, data):
+        HarvesterResponseChunk(
+            host=resp.host,
+            url_hash=resp.url_hash,
+            method=resp.method,
+            url=resp.url,
+            index=index,
+            data=encode(data) if encode else data
+        ).save()
+
+    held, index = [], 0
+    for data in response.iter_content(settings.RESPONSE_CHUNK_SIZE):
+        if held is not None:
+            held.append(data)
+            if sum(len(piece) for piece in held) > settings.RESPONSE_CHUNK_SIZE:
+                for piece in held:
+                    save_chunk(index, piece)
+                    index += 1
+                held = None
+        else:
+            save_chunk(index, data)
+            index += 1
+        yield data
+
+    if held is None:
+        resp.chunks = index
+    else:
+        resp.chunks = None
+        resp.content = b''.join(held)
+    _save_response(resp)
+
+
+def _conditional_headers(resp):
+    """Validators for revalidating a recorded response, if the host gave any"""
+    if not (resp and resp.ok and resp.headers_str):
+        return {}
+
+    headers, conditional = resp.headers, {}
+    if headers.get('ETag'):
+        conditional['If-None-Match'] = headers['ETag']
+    if headers.get('Last-Modified'):
+        conditional['If-Modified-Since'] = headers['Last-Modified']
+    return conditional
+
+
 def record_or_load_response(method, url, throttle=None, force=False, params=None, **kwargs):
     if params:
         url = furl.furl(url).set(args=params).url
 
-    resp = _maybe_load_response(method, url)
+    key_url = canonical_url(url)
+    resp = _maybe_load_response(method, key_url, original_url=url)
 
     if not force and resp and resp.ok:
         logger.info('Return recorded response from "{}"'.format(url))
+        metrics.record_recorded(url, 'hit')
         return resp
 
+    metrics.record_recorded(url, 'miss')
+
+    archive = replay.active()
+    if archive is not None and archive.offline:
+        if resp:
+            return resp
+        raise replay.ReplayMiss('No recorded response from "{}" in "{}"'.format(url, archive.path))
+
     if force:
         logger.warning('Force updating request to "{}"'.format(url))
     else:
         logger.info('Making request to "{}"'.format(url))
 
-    if throttle:
-        time.sleep(throttle)
+    conditional = _conditional_headers(resp) if method == 'get' else {}
+    if conditional:
+        kwargs['headers'] = dict(conditional, **(kwargs.get('headers') or {}))
+
+    response = _send(method, url, throttle=throttle, **kwargs)
 
-    response = requests.request(method, url, **kwargs)
+    if conditional and response.status_code == 304:
+        logger.info('Recorded response from "{}" has not been modified'.format(url))
+        metrics.record_recorded(url, 'notModified')
+        return _save_response(resp, time_made=datetime.now())
 
     if not response.ok:
         events.log_to_sentry('Got non-ok response code.', url=url, method=method)
 
-    if not resp:
-        return HarvesterResponse(
-            url=url,
-            method=method,
-            ok=response.ok,
-            content=response.content,
-            encoding=response.encoding,
-            status_code=response.status_code,
-            headers_str=json.dumps(dict(response.headers))
-        ).save()
-
-    logger.warning('Skipped recorded response from "{}"'.format(url))
-
-    return resp.update(
+    values = dict(
         ok=response.ok,
-        content=response.content,
         encoding=response.encoding,
         status_code=response.status_code,
         headers_str=json.dumps(dict(response.headers))
-    ).save()
+    )
+
+    if kwargs.get('stream') and archive is None:
+        if resp:
+            logger.warning('Skipped recorded response from "{}"'.format(url))
+        else:
+            resp = HarvesterResponse(url=key_url, method=method)
+
+        # The body is recorded as the caller reads it, see iter_chunks
+        for name, value in dict(values, body=None, codec=settings.RESPONSE_CODEC, chunks=None, time_made=datetime.now()).items():
+            setattr(resp, name, value)
+        resp._recording = _record_chunks(resp, response)
+        return resp
+
+    values.update(content=response.content, chunks=None)
+
+    if not resp:
+        return _save_response(HarvesterResponse(url=key_url, method=method, **values))
+
+    logger.warning('Skipped recorded response from "{}"'.format(url))
+
+    return _save_response(resp, **values)
+
+
+class SingleFlight(object):
+    """Collapses concurrent calls with the same key into a single call
+    The first caller does the work, the rest wait for and share its result or exception
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, func, *args, **kwargs):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = {'done': threading.Event()}
+
+        if not leader:
+            call['done'].wait()
+            if 'error' in call:
+                raise call['error']
+            return call['result']
+
+        try:
+            call['result'] = func(*args, **kwargs)
+        except Exception as e:
+            call['error'] = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call['done'].set()
+
+        return call['result']
+
+
+_in_flight = SingleFlight()
+
+# Keywords that a request may be collapsed with an identical one under
+SINGLE_FLIGHT_KWARGS = frozenset(('params', 'headers', 'throttle', 'force', 'stream', 'timeout'))
+
+
+def _freeze(value):
+    if isinstance(value, dict):
+        return tuple(sorted(value.items()))
+    if isinstance(value, list):
+        return tuple(value)
+    return value
+
+
+def _flight_key(method, url, kwargs):
+    """The key identical requests share, or None if this request may not be shared"""
+    if set(kwargs) - SINGLE_FLIGHT_KWARGS:
+        return None
+
+    # Streamed bodies can only be read once, unless they are read in full into a replay archive
+    if kwargs.get('stream') and replay.active() is None:
+        return None
+
+    key = (method, url) + tuple((name, _freeze(kwargs[name])) for name in sorted(kwargs) if name != 'throttle')
+    try:
+        hash(key)
+    except TypeError:
+        return None
+    return key
+
+
+def prefetch(harvester_name, start_date, end_date=None, workers=None):
+    """Load the responses harvester_name recorded between start_date and end_date into the response cache
+    Each day's index is read concurrently, then responses, and the chunks of those recorded in chunks,
+    are fetched a host at a time in batches of PREFETCH_BATCH_SIZE. Returns the number of responses loaded.
+
+    :param date start_date: The first day recordings were made on
+    :param date end_date: The last day recordings were made on, defaults to today
+    :param int workers: The number of concurrent queries, defaults to PREFETCH_WORKERS
+    """
+    end_date = end_date or date.today()
+    days = [
+        (start_date + timedelta(days=offset)).isoformat()
+        for offset in range((end_date - start_date).days + 1)
+    ]
+
+    def read_index(day):
+        return [
+            (entry.host, entry.url_hash)
+            for entry in RecordedResponseIndex.objects(harvester=harvester_name, day=day).limit(None)
+        ]
+
+    def load(batch):
+        host, url_hashes = batch
+        responses = list(HarvesterResponse.objects(host=host, url_hash__in=url_hashes).limit(None))
+
+        # Bodies recorded in chunks are loaded too, so that reading them needs no more queries
+        chunked, chunks = [resp.url_hash for resp in responses if resp.chunks], {}
+        if chunked:
+            for chunk in HarvesterResponseChunk.objects(host=host, url_hash__in=chunked).limit(None):
+                chunks.setdefault((chunk.method, chunk.url), {})[chunk.index] = chunk.data
+
+        return [(resp, chunks.get((resp.method, resp.url), {})) for resp in responses]
+
+    pool = ThreadPool(workers or settings.PREFETCH_WORKERS)
+    try:
+        hosts = {}
+        for entries in pool.map(read_index, days):
+            for host, url_hash in entries:
+                hosts.setdefault(host, set()).add(url_hash)
+
+        batches = [
+            (host, url_hashes[i:i + settings.PREFETCH_BATCH_SIZE])
+            for host, url_hashes in ((host, sorted(hashes)) for host, hashes in hosts.items())
+            for i in range(0, len(url_hashes), settings.PREFETCH_BATCH_SIZE)
+        ]
+
+        count, size = 0, 0
+        for responses in pool.imap_unordered(load, batches):
+            for resp, chunks in responses:
+                size += cache.byte_size(dict(_cache_response(resp)))
+                count += 1
+
+                if resp.chunks and all(index in chunks for index in range(resp.chunks)):
+                    data = [chunks[index] for index in range(resp.chunks)]
+                    cache.responses().set(_chunks_key(resp), data)
+                    size += cache.byte_size(data)
+    finally:
+        pool.close()
+
+    if size > settings.RESPONSE_CACHE_BYTES:
+        logger.warning('Prefetched {} bytes of responses for "{}" but RESPONSE_CACHE_BYTES is {}'.format(
+            size, harvester_name, settings.RESPONSE_CACHE_BYTES
+        ))
+    logger.info('Prefetched {} recorded responses for "{}"'.format(count, harvester_name))
+    return count
+
+
+def rate_limit_stats():
+    """The per host wait times and current request intervals of the rate limiter"""
+    return ratelimit.limiter.stats()
+
+
+def http_stats(harvester=None):
+    """Per host request metrics, for every request or only those made by harvester
+    Only collected when HTTP_METRICS is set, see scrapi/metrics.py
+    """
+    return metrics.stats(harvester)
 
 
 def request(method, url, **kwargs):
     """Make a recorded request or get a record matching method and url
+    Requests are recorded to Cassandra when RECORD_HTTP_TRANSACTIONS is set,
+    or to the replay archive when one is active, see scrapi/replay.py
+    Identical requests made at the same time from several threads are only made once
 
     :param str method: Get, Put, Post, or Delete
     :param str url: Where to make the request to
     :param bool force: Whether or not to force the new request to be made
-    :param int throttle: A time in seconds to sleep before making requests
+    :param bool stream: Whether to stream the body, read it from the response's raw attribute
+    :param int throttle: The time in seconds to start with between requests to this host
     :param dict kwargs: Addition keywords to pass to requests
     """
-    if settings.RECORD_HTTP_TRANSACTIONS:
+    key = settings.SINGLE_FLIGHT_REQUESTS and _flight_key(method, url, kwargs)
+    if key:
+        return _in_flight.do(key, _request, method, url, **kwargs)
+    return _request(method, url, **kwargs)
+
+
+def _request(method, url, **kwargs):
+    if settings.RECORD_HTTP_TRANSACTIONS or replay.active() is not None:
         return record_or_load_response(method, url, **kwargs)
 
+    kwargs.pop('force', None)
+
     logger.info('Making request to "{}"'.format(url))
-    return requests.request(method, url, **kwargs)
+    return _send(method, url, **kwargs)
+
+
+def fetch_all(urls, method='get', workers=None, per_host=None, retries=1, **kwargs):
+    """Concurrently make a request to each url, yielding (url, response) pairs as they complete
+    Requests are recorded and rate limited exactly as if request had been called for each url.
+    Urls that still fail with a connection error after retrying are logged and skipped.
+
+    :param list urls: The urls to request
+    :param int workers: The maximum number of requests in flight, defaults to HTTP_FANOUT_WORKERS
+    :param int per_host: The maximum number of requests in flight to a single host,
+        defaults to HTTP_FANOUT_PER_HOST
+    :param int retries: How many times to retry a url after a connection error
+    :param dict kwargs: Addition keywords to pass to request
+    """
+    urls = list(urls)
+    if not urls:
+        return
+
+    per_host = per_host or settings.HTTP_FANOUT_PER_HOST
+    hosts, hosts_lock = {}, threading.Lock()
+
+    def fetch(url):
+        host = furl.furl(url).host
+        with hosts_lock:
+            semaphore = hosts.setdefault(host, threading.BoundedSemaphore(per_host))
+
+        for attempt in range(retries + 1):
+            try:
+                with semaphore:
+                    return url, request(method, url, **kwargs)
+            except exceptions.ConnectionError as e:
+                logger.warning('Connection error on attempt {} for "{}": {}'.format(attempt + 1, url, e))
+
+        logger.error('Giving up on "{}" after {} attempts'.format(url, retries + 1))
+        return url, None
+
+    pool = ThreadPool(min(workers or settings.HTTP_FANOUT_WORKERS, len(urls)))
+
+    try:
+        for url, response in pool.imap_unordered(metrics.bind(fetch), urls):
+            if response is not None:
+                yield url, response
+    finally:
+        pool.terminate()
 
 
 get = functools.partial(request, 'get')
@@ -2,10 +2,72 @@ DEBUG = False
 
 BROKER_URL = 'amqp://guest@localhost'
 
+# Run tasks in process, which also lets raw documents carry their parsed records into normalization
+CELERY_ALWAYS_EAGER = False
 CELERY_EAGER_PROPAGATES_EXCEPTIONS = True
 
 RECORD_HTTP_TRANSACTIONS = False
 
+# Recorded responses expire after RECORDED_RESPONSE_TTL seconds, None keeps them forever
+RECORDED_RESPONSE_TTL = None
+RECORDED_RESPONSE_GC_GRACE = 24 * 60 * 60
+# How recorded bodies are compressed, one of scrapi.requests.CODECS or None
+RESPONSE_CODEC = 'zlib'
+# Streamed bodies over RESPONSE_CHUNK_SIZE bytes are stored in chunks of about that size and read back
+# RESPONSE_CHUNK_PAGE at a time, smaller ones are stored inline
+RESPONSE_CHUNK_SIZE = 256 * 1024
+RESPONSE_CHUNK_PAGE = 8
+# Index recorded responses by harvester and day so scrapi.requests.prefetch can load them in bulk
+INDEX_RECORDED_RESPONSES = True
+PREFETCH_WORKERS = 8
+PREFETCH_BATCH_SIZE = 100
+# Fall back to (and migrate from) the unpartitioned responses table on a miss. This reads its single
+# giant partition, only turn it on while scripts/migrate_responses.py has not been run yet
+READ_LEGACY_RESPONSES = False
+# Fall back to (and move from) responses recorded under urls that are not canonical. This doubles
+# the reads of every miss, only turn it on while responses recorded before canonical urls are still needed
+READ_UNCANONICAL_RESPONSES = False
+
+# Record requests to and replay them from a local archive directory instead of Cassandra
+# REPLAY_OFFLINE fails requests that are not in the archive rather than making them
+REPLAY_ARCHIVE = None
+REPLAY_OFFLINE = False
+
+RESUMABLE_HARVESTS = False
+
+# Raw documents normalized and processed per task, harvesters may override it with normalize_batch_size
+NORMALIZE_BATCH_SIZE = 1
+
+# Connections kept alive per host, HTTP_POOL_SIZES overrides it by host name
+HTTP_POOL_MAXSIZE = 10
+HTTP_POOL_SIZES = {}
+
+# Collect per host and per harvester request metrics, see scrapi/metrics.py
+HTTP_METRICS = False
+
+# Share one request between threads making identical requests at the same time
+SINGLE_FLIGHT_REQUESTS = True
+
+# Concurrency of scrapi.requests.fetch_all
+HTTP_FANOUT_WORKERS = 8
+HTTP_FANOUT_PER_HOST = 4
+
+# Per host rate limiting, see scrapi/ratelimit.py
+RATE_LIMIT_BURST = 1
+RATE_LIMIT_RETRIES = 3
+RATE_LIMIT_MIN_RATIO = 0.25
+RATE_LIMIT_FAST_RESPONSE = 1.0
+
+# Local caches of recorded responses, see scrapi/cache.py
+# The memory tier holds at most RESPONSE_CACHE_BYTES of (compressed) bodies and skips any over RESPONSE_CACHE_MAX_ENTRY
+# RESPONSE_DISK_CACHE is a directory to keep an sqlite file per host in, None disables it
+RESPONSE_CACHE_BYTES = 64 * 1024 * 1024
+RESPONSE_CACHE_MAX_ENTRY = 4 * 1024 * 1024
+RESPONSE_CACHE_TTL = 60 * 60
+RESPONSE_DISK_CACHE = None
+RESPONSE_DISK_CACHE_BYTES = 4 * 1024 * 1024 * 1024
+RESPONSE_DISK_CACHE_TTL = 7 * 24 * 60 * 60
+
 RAW_PROCESSING = []
 NORMALIZED_PROCESSING = []
 
@@ -5,11 +5,13 @@ from celery import Celery
 
 from scrapi import util
 from scrapi import events
+from scrapi import metrics
 from scrapi import database
 from scrapi import settings
 from scrapi import registry
 from scrapi import processing
 from scrapi.util import timestamp
+from scrapi.base import OAIHarvester
 
 
 app = Celery()
@@ -39,7 +41,14 @@ def harvest(harvester_name, job_created, days_back=1):
 
     logger.info('Harvester "{}" has begun harvesting'.format(harvester_name))
 
-    result = harvester.harvest(days_back=days_back)
+    try:
+        with metrics.harvesting(harvester_name):
+            if settings.RESUMABLE_HARVESTS and isinstance(harvester, OAIHarvester):
+                result = harvest_resumable(harvester, job_created, harvest_started, days_back)
+            else:
+                result = harvester.harvest(days_back=days_back)
+    finally:
+        metrics.emit(harvester_name)
 
     # result is a list of all of the RawDocuments harvested
     return result, {
@@ -49,6 +58,21 @@ def harvest(harvester_name, job_created, days_back=1):
     }
 
 
+def harvest_resumable(harvester, job_created, harvest_started, days_back):
+    """Hand off each page for normalization as soon as it is harvested
+    so that it is safe to checkpoint and resume after that page
+    """
+    for page in harvester.harvest_pages(days_back=days_back, resumable=True):
+        begin_normalization.delay((page, {
+            'harvestFinished': timestamp(),
+            'harvestTaskCreated': job_created,
+            'harvestStarted': harvest_started,
+        }), harvester.short_name)
+
+    # Everything has already been sent off to normalization
+    return []
+
+
 @app.task
 def begin_normalization((raw_docs, timestamps), harvester_name):
     '''harvest_ret is harvest return value:
@@ -57,11 +81,22 @@ def begin_normalization((raw_docs, timestamps), harvester_name):
     '''
     logger.info('Normalizing {} documents for harvester "{}"'
                 .format(len(raw_docs), harvester_name))
+    batch_size = normalize_batch_size(harvester_name)
+    if batch_size > 1:
+        for i in xrange(0, len(raw_docs), batch_size):
+            spawn_batch(raw_docs[i:i + batch_size], timestamps, harvester_name)
+        return
+
     # raw is a single raw document
     for raw in raw_docs:
         spawn_tasks(raw, timestamps, harvester_name)
 
 
+def normalize_batch_size(harvester_name):
+    harvester = registry.get(harvester_name)
+    return getattr(harvester, 'normalize_batch_size', None) or settings.NORMALIZE_BATCH_SIZE
+
+
 @events.creates_task(events.PROCESSING)
 @events.creates_task(events.NORMALIZATION)
 def spawn_tasks(raw, timestamps, harvester_name):
@@ -73,6 +108,24 @@ def spawn_tasks(raw, timestamps, harvester_name):
         process_raw.delay(raw)
 
 
+def spawn_batch(raw_docs, timestamps, harvester_name):
+    for raw in raw_docs:
+        stamp_batched(raw, timestamps, harvester_name)
+
+    chain = (normalize_batch.si(raw_docs, harvester_name) | process_normalized_batch.s(raw_docs))
+
+    chain.apply_async()
+    process_raw_batch.delay(raw_docs)
+
+
+@events.creates_task(events.PROCESSING)
+@events.creates_task(events.NORMALIZATION)
+def stamp_batched(raw, timestamps, harvester_name):
+    # Dispatches the same created events as spawn_tasks for each document of a batch
+    raw['timestamps'] = timestamps
+    raw['timestamps']['normalizeTaskCreated'] = timestamp()
+
+
 @app.task
 @events.logged(events.PROCESSING, 'raw')
 def process_raw(raw_doc, **kwargs):
@@ -103,6 +156,39 @@ def process_normalized(normalized_doc, raw_doc, **kwargs):
     processing.process_normalized(raw_doc, normalized_doc, kwargs)
 
 
+@app.task
+def process_raw_batch(raw_docs, **kwargs):
+    for raw_doc in raw_docs:
+        try:
+            process_raw(raw_doc, **kwargs)
+        except Exception:
+            logger.exception('Failed to process raw document with id {}'.format(raw_doc['docID']))
+
+
+@app.task
+def normalize_batch(raw_docs, harvester_name):
+    """Normalize raw_docs one at a time, each logging its own events,
+    so that a failing document does not lose the rest of the batch
+    """
+    normalized_docs = []
+    for raw_doc in raw_docs:
+        try:
+            normalized_docs.append(normalize(raw_doc, harvester_name))
+        except Exception:
+            logger.exception('Failed to normalize document with id {}'.format(raw_doc['docID']))
+            normalized_docs.append(None)
+    return normalized_docs
+
+
+@app.task
+def process_normalized_batch(normalized_docs, raw_docs, **kwargs):
+    for normalized_doc, raw_doc in zip(normalized_docs, raw_docs):
+        try:
+            process_normalized(normalized_doc, raw_doc, **kwargs)
+        except Exception:
+            logger.exception('Failed to process document with id {}'.format(raw_doc['docID']))
+
+
 @app.task
 def update_pubsubhubbub():
     payload = {'hub.mode': 'publish', 'hub.url': '{url}rss/'.format(url=settings.OSF_APP_URL)}
@@ -0,0 +1,64 @@
+"""Time the per document cost of transforming an OAI record
+    with the schema rebuilt for every document, as OAIHarvester.schema used to,
+    against the memoized schema and its compiled plan.
+
+    python -m scripts.benchmark_oai_schema [harvester] [documents]
+"""
+import sys
+import timeit
+
+from lxml import etree
+
+from scrapi import registry
+from scrapi.base import OAIHarvester
+import scrapi.harvesters  # noqa
+
+RECORD = '''
+<record xmlns="http://www.openarchives.org/OAI/2.0/">
+    <header>
+        <identifier>oai:digitalcommons.calpoly.edu:aged_rpt-1085</identifier>
+        <datestamp>2014-10-07T00:30:57Z</datestamp>
+        <setSpec>publication:aged_rpt</setSpec>
+    </header>
+    <metadata>
+        <oai_dc:dc xmlns:oai_dc="http://www.openarchives.org/OAI/2.0/oai_dc/" xmlns:dc="http://purl.org/dc/elements/1.1/">
+            <dc:title>Test</dc:title>
+            <dc:creator>Mills, Donald W, Jr.</dc:creator>
+            <dc:description>This internship report consists of two parts.</dc:description>
+            <dc:date>2014-05-01T07:00:00Z</dc:date>
+            <dc:type>text</dc:type>
+            <dc:format>application/pdf</dc:format>
+            <dc:identifier>http://digitalcommons.calpoly.edu/aged_rpt/64</dc:identifier>
+            <dc:source>Graduate Internship Reports in Agricultural Education</dc:source>
+            <dc:publisher>DigitalCommons@CalPoly</dc:publisher>
+        </oai_dc:dc>
+    </metadata>
+</record>
+'''
+
+
+def per_document(func, number):
+    return min(timeit.repeat(func, number=number, repeat=3)) / number * 1e6
+
+
+def main(harvester_name='calpoly', number=2000):
+    harvester = registry[harvester_name]
+    assert isinstance(harvester, OAIHarvester), '{} is not an OAI harvester'.format(harvester_name)
+    doc = etree.XML(RECORD)
+
+    assert harvester._transform(harvester.build_schema(), doc) == harvester.transform(doc)
+
+    rebuilt_schema = per_document(harvester.build_schema, number)
+    memoized_schema = per_document(lambda: harvester.schema, number)
+    rebuilt = per_document(lambda: harvester._transform(harvester.build_schema(), doc), number)
+    memoized = per_document(lambda: harvester.transform(doc), number)
+
+    print('{} ({} documents)'.format(harvester_name, number))
+    print('  schema:    rebuilt {:8.1f}us  memoized {:8.1f}us'.format(rebuilt_schema, memoized_schema))
+    print('  transform: rebuilt {:8.1f}us  memoized {:8.1f}us  saving {:.0%}'.format(
+        rebuilt, memoized, 1 - memoized / rebuilt
+    ))
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:2], **({'number': int(sys.argv[2])} if len(sys.argv) > 2 else {}))
@@ -0,0 +1,50 @@
+"""Copy recorded responses from the unpartitioned responses table into harvester_responses
+    Rows are streamed a page at a time, in url order within each method,
+    so memory use is bounded by the batch size. Rerunning is safe.
+    Responses are stored under their canonical url, see scrapi.requests.canonical_url
+"""
+import logging
+
+from cqlengine.connection import LOG
+
+from scrapi import database
+from scrapi import requests
+
+logger = logging.getLogger(__name__)
+LOG.setLevel(logging.WARN)
+
+METHODS = ('get', 'put', 'post', 'delete')
+
+
+def iter_legacy_responses(method, batch_size=500):
+    last_url = None
+    while True:
+        query = requests.LegacyHarvesterResponse.objects(method=method)
+        if last_url is not None:
+            query = query.filter(url__gt=last_url)
+
+        page = list(query.limit(batch_size))
+        for legacy in page:
+            yield legacy
+
+        if len(page) < batch_size:
+            return
+        last_url = page[-1].url
+
+
+def migrate(methods=METHODS, batch_size=500):
+    count = 0
+    database.setup()
+    for method in methods:
+        for legacy in iter_legacy_responses(method, batch_size=batch_size):
+            requests.migrate_legacy_response(legacy)
+            count += 1
+            if count % batch_size == 0:
+                logger.info('Migrated {} responses'.format(count))
+    logger.info('Migrated {} responses in total'.format(count))
+    return count
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    migrate()
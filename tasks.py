@@ -1,3 +1,4 @@
+import os
 import logging
 import platform
 
@@ -74,14 +75,28 @@ def worker():
 
 
 @task
-def harvester(harvester_name, async=False, days=1):
+def harvester(harvester_name, async=False, days=1, replay=None, offline=False, prefetch_since=None):
     settings.CELERY_ALWAYS_EAGER = not async
     from scrapi.tasks import run_harvester
 
     if not registry.get(harvester_name):
         raise ValueError('No such harvesters {}'.format(harvester_name))
 
-    run_harvester.delay(harvester_name, days_back=days)
+    if prefetch_since:
+        from dateutil.parser import parse
+        from scrapi.requests import prefetch
+        prefetch(harvester_name, parse(prefetch_since).date())
+
+    if not replay:
+        run_harvester.delay(harvester_name, days_back=days)
+        return
+
+    if async:
+        raise ValueError('Replay archives can only be used with synchronous harvests')
+
+    from scrapi.replay import archive
+    with archive(os.path.join(replay, harvester_name), offline=offline):
+        run_harvester.delay(harvester_name, days_back=days)
 
 
 @task
@@ -114,6 +129,12 @@ def check_archive(harvester=None, reprocess=False, async=False, days=None):
         check_archives.delay(reprocess, days_back=int(days))
 
 
+@task
+def migrate_responses(batch_size=500):
+    from scripts.migrate_responses import migrate
+    migrate(batch_size=int(batch_size))
+
+
 @task
 def lint_all():
     for name in registry.keys():
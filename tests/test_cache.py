@@ -0,0 +1,149 @@
+import sqlite3
+
+import mock
+import pytest
+
+from scrapi import cache
+
+
+@pytest.fixture
+def mock_time(monkeypatch):
+    mock_time = mock.Mock(return_value=1000.0)
+    monkeypatch.setattr(cache.time, 'time', mock_time)
+    return mock_time
+
+
+@pytest.fixture(params=['memory', 'disk'])
+def tier(request, tmpdir):
+    if request.param == 'memory':
+        return cache.MemoryCache(2, 60, sizeof=lambda value: 1)
+    return cache.DiskCache(str(tmpdir.join('cache.sqlite')), 2, 60, sizeof=lambda data: 1)
+
+
+class TestTiers(object):
+
+    def test_get_and_set(self, tier):
+        assert tier.get('key') is None
+
+        tier.set('key', {'content': 'rawr'})
+
+        assert tier.get('key') == {'content': 'rawr'}
+
+    def test_delete(self, tier):
+        tier.set('key', 'value')
+        tier.delete('key')
+
+        assert tier.get('key') is None
+
+    def test_expires(self, tier, mock_time):
+        tier.set('key', 'value')
+        mock_time.return_value += 61
+
+        assert tier.get('key') is None
+
+    def test_evicts_least_recently_used(self, tier, mock_time):
+        tier.set('a', 1)
+        mock_time.return_value += 1
+        tier.set('b', 2)
+        mock_time.return_value += 1
+        tier.get('a')
+        mock_time.return_value += 1
+        tier.set('c', 3)
+        if isinstance(tier, cache.DiskCache):
+            tier.evict()
+
+        assert tier.get('b') is None
+        assert tier.get('a') == 1
+        assert tier.get('c') == 3
+
+    def test_clear(self, tier):
+        tier.set('key', 'value')
+        tier.clear()
+
+        assert tier.get('key') is None
+
+
+class TestMemoryCache(object):
+
+    def test_evicts_by_bytes(self):
+        memory = cache.MemoryCache(10, 60)
+        memory.set('a', {'body': 'x' * 4})
+        memory.set('b', {'body': 'x' * 4})
+        memory.set('c', {'body': 'x' * 4})
+
+        assert memory.get('a') is None
+        assert memory.get('b') and memory.get('c')
+        assert memory.size == 8
+
+    def test_skips_large_entries(self):
+        memory = cache.MemoryCache(100, 60, max_entry=10)
+        memory.set('a', {'body': 'x' * 4})
+        memory.set('a', {'body': 'x' * 11})
+
+        assert memory.get('a') is None
+        assert memory.size == 0
+
+    def test_byte_size(self):
+        assert cache.byte_size({'body': 'abc', 'headers_str': '{}', 'status_code': 200, 'chunks': None}) == 5
+
+
+class TestDiskCache(object):
+
+    def test_evicts_by_bytes(self, tmpdir, mock_time):
+        disk = cache.DiskCache(str(tmpdir.join('cache.sqlite')), 10, 60, sizeof=lambda data: 4)
+        for key in 'abc':
+            disk.set(key, {'body': 'rawr'})
+            mock_time.return_value += 1
+        disk.get('a')
+        disk.evict()
+
+        assert disk.get('b') is None
+        assert disk.get('a') and disk.get('c')
+
+    def test_sizes_pickled_values(self, tmpdir):
+        disk = cache.DiskCache(str(tmpdir.join('cache.sqlite')), 1024, 60)
+        disk.set('a', {'body': 'x' * 100})
+        disk.set('b', {'body': 'x' * 2000})
+
+        assert disk._db.execute('SELECT size FROM cache WHERE key = ?', ('a', )).fetchone()[0] > 100
+        assert disk.get('b') is None
+
+    def test_sizes_old_caches(self, tmpdir):
+        path = str(tmpdir.join('cache.sqlite'))
+        sqlite3.connect(path).execute('CREATE TABLE cache (key TEXT PRIMARY KEY, value BLOB, stored REAL, accessed REAL)')
+
+        disk = cache.DiskCache(path, 1024, 60)
+        disk.set('a', 'rawr')
+        disk.evict()
+
+        assert disk.get('a') == 'rawr'
+
+
+class TestTieredCache(object):
+
+    def test_fills_faster_tiers(self, tmpdir):
+        memory = cache.MemoryCache(10, 60)
+        disk = cache.DiskCache(str(tmpdir.join('cache.sqlite')), 1024 * 1024, 60)
+        disk.set('key', 'value')
+        tiered = cache.TieredCache(memory, disk)
+
+        assert tiered.get('key') == 'value'
+        assert memory.get('key') == 'value'
+
+    def test_writes_through(self, tmpdir):
+        memory = cache.MemoryCache(10, 60)
+        disk = cache.DiskCache(str(tmpdir.join('cache.sqlite')), 1024 * 1024, 60)
+        tiered = cache.TieredCache(memory, disk)
+
+        tiered.set('key', 'value')
+
+        assert memory.get('key') == disk.get('key') == 'value'
+
+    def test_disk_tier_is_optional(self, monkeypatch, tmpdir):
+        monkeypatch.setattr(cache, '_responses', None)
+        monkeypatch.setattr(cache.settings, 'RESPONSE_DISK_CACHE', None)
+        assert len(cache.responses().tiers) == 1
+
+        monkeypatch.setattr(cache, '_responses', None)
+        monkeypatch.setattr(cache.settings, 'RESPONSE_DISK_CACHE', str(tmpdir))
+        assert isinstance(cache.responses().tiers[1], cache.DiskCache)
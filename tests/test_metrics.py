@@ -0,0 +1,94 @@
+import mock
+import pytest
+
+from scrapi import metrics
+
+
+@pytest.fixture(autouse=True)
+def enabled(monkeypatch):
+    monkeypatch.setattr(metrics.settings, 'HTTP_METRICS', True)
+    monkeypatch.setattr(metrics, '_metrics', metrics.Metrics())
+
+
+def response(status_code=200, content='rawr', headers=None):
+    return mock.Mock(status_code=status_code, content=content, headers=headers or {})
+
+
+class TestHistogram(object):
+
+    def test_observe(self):
+        histogram = metrics.Histogram(buckets=(1, 10, float('inf')))
+
+        for value in (0.5, 2, 3, 100):
+            histogram.observe(value)
+
+        stats = histogram.stats()
+        assert stats['count'] == 4
+        assert stats['max'] == 100
+        assert stats['mean'] == 105.5 / 4
+        assert stats['buckets'] == [[1, 1], [10, 2], [float('inf'), 1]]
+
+
+class TestMetrics(object):
+
+    def test_records_per_host(self):
+        metrics.record_request('http://dinosaurs.sexy/a', response(), 0.2)
+        metrics.record_request('http://dinosaurs.sexy/b', response(status_code=404, content='no'), 0.4)
+        metrics.record_request('http://other.place/', response(), 0.1)
+        metrics.record_wait('http://dinosaurs.sexy/a', 2)
+        metrics.record_recorded('http://dinosaurs.sexy/a', 'hit')
+
+        stats = metrics.stats()
+        assert set(stats) == {'dinosaurs.sexy', 'other.place'}
+        assert stats['dinosaurs.sexy']['requests'] == 2
+        assert stats['dinosaurs.sexy']['bytes'] == 6
+        assert stats['dinosaurs.sexy']['statuses'] == {'200': 1, '404': 1}
+        assert abs(stats['dinosaurs.sexy']['latency']['total'] - 0.6) < 1e-9
+        assert stats['dinosaurs.sexy']['throttle']['total'] == 2
+        assert stats['dinosaurs.sexy']['recorded'] == {'hit': 1}
+
+    def test_streamed_sizes_come_from_headers(self):
+        resp = response(headers={'Content-Length': '42'})
+
+        metrics.record_request('http://dinosaurs.sexy', resp, 0.1, stream=True)
+
+        assert metrics.stats()['dinosaurs.sexy']['bytes'] == 42
+
+    def test_records_per_harvester(self):
+        with metrics.harvesting('test'):
+            metrics.record_request('http://dinosaurs.sexy', response(), 0.1)
+        metrics.record_request('http://dinosaurs.sexy', response(), 0.1)
+
+        assert metrics.stats('test')['dinosaurs.sexy']['requests'] == 1
+        assert metrics.stats()['dinosaurs.sexy']['requests'] == 2
+
+    def test_bind_carries_harvester(self):
+        with metrics.harvesting('test'):
+            bound = metrics.bind(metrics.current_harvester)
+
+        assert metrics.current_harvester() is None
+        assert bound() == 'test'
+
+    def test_emit_dispatches_and_clears(self, monkeypatch):
+        mock_dispatch = mock.Mock()
+        monkeypatch.setattr(metrics.events, 'dispatch', mock_dispatch)
+        with metrics.harvesting('test'):
+            metrics.record_request('http://dinosaurs.sexy', response(), 0.1)
+
+        metrics.emit('test')
+
+        mock_dispatch.assert_called_once_with(
+            metrics.events.HTTP_METRICS, metrics.events.COMPLETED,
+            harvester='test', hosts={'dinosaurs.sexy': mock.ANY}
+        )
+        assert metrics.stats('test') == {}
+
+    def test_disabled(self, monkeypatch):
+        monkeypatch.setattr(metrics.settings, 'HTTP_METRICS', False)
+        resp = response()
+
+        metrics.record_request('http://dinosaurs.sexy', resp, 0.1)
+        metrics.record_wait('http://dinosaurs.sexy', 1)
+        metrics.record_recorded('http://dinosaurs.sexy', 'hit')
+
+        assert metrics.stats() == {}
@@ -1,9 +1,19 @@
 from __future__ import unicode_literals
 
+import pickle
+from io import BytesIO
+
+import mock
+import pytest
+from lxml import etree
+
+from scrapi import base
+from scrapi import settings
 from scrapi.base import OAIHarvester
+from scrapi.base.helpers import OAIPageReader
 from scrapi.linter import RawDocument
 
-from .utils import TEST_OAI_DOC
+from .utils import TEST_OAI_DOC, oai_page, oai_headers
 
 
 class TestHarvester(OAIHarvester):
@@ -22,6 +32,36 @@ class TestHarvester(OAIHarvester):
         }) for _ in xrange(days_back)]
 
 
+class TestPagedHarvester(OAIHarvester):
+    base_url = 'http://test.org/oai'
+    long_name = 'Paged Test'
+    short_name = 'testpaged'
+    url = 'test'
+    timeout = 0
+
+
+def first_page(harvester, days_back=1):
+    start_date = str(base.date.today() - base.timedelta(days_back))
+    return harvester.base_url + harvester.RECORDS_URL + harvester.META_PREFIX_DATE.format(start_date)
+
+
+def next_page(harvester, token):
+    return harvester.base_url + harvester.RECORDS_URL + harvester.RESUMPTION + token
+
+
+@pytest.fixture
+def pages(monkeypatch):
+    responses = {}
+
+    def get(url, **kwargs):
+        return mock.Mock(content=responses[url], raw=BytesIO(responses[url]))
+
+    mock_get = mock.Mock(side_effect=get)
+    monkeypatch.setattr(base.requests, 'get', mock_get)
+    mock_get.responses = responses
+    return mock_get
+
+
 class TestOAIHarvester(object):
 
     def setup_method(self, method):
@@ -34,3 +74,360 @@ class TestOAIHarvester(object):
 
         for res in results:
             assert res['title'] == 'Test'
+
+    def test_schema_is_memoized(self):
+        schema = self.harvester.schema
+
+        assert self.harvester.schema is schema
+        assert set(schema['properties']) == set(self.harvester.property_list)
+
+    def test_schema_follows_property_list(self):
+        schema = self.harvester.schema
+
+        self.harvester.property_list = ['type', 'rights']
+
+        assert self.harvester.schema is not schema
+        assert set(self.harvester.schema['properties']) == {'type', 'rights'}
+
+    def test_harvest_follows_resumption_tokens(self, pages):
+        harvester = TestPagedHarvester()
+        pages.responses[first_page(harvester)] = oai_page(['a', 'b'], token='tok1')
+        pages.responses[next_page(harvester, 'tok1')] = oai_page(['c'], token='tok2')
+        pages.responses[next_page(harvester, 'tok2')] = oai_page(['d'])
+
+        results = harvester.harvest()
+
+        assert isinstance(results, list)
+        assert [doc['docID'] for doc in results] == ['a', 'b', 'c', 'd']
+        assert all(isinstance(doc, RawDocument) for doc in results)
+        assert pages.call_count == 3
+
+    def test_harvest_iter_is_lazy(self, pages):
+        harvester = TestPagedHarvester()
+        pages.responses[first_page(harvester)] = oai_page(['a'], token='tok1')
+        pages.responses[next_page(harvester, 'tok1')] = oai_page(['b'])
+
+        docs = harvester.harvest_iter()
+
+        assert next(docs)['docID'] == 'a'
+        assert pages.call_count == 1
+        assert next(docs)['docID'] == 'b'
+        assert pages.call_count == 2
+
+    def test_get_records_keeps_records(self, pages):
+        harvester = TestPagedHarvester()
+        pages.responses[first_page(harvester)] = oai_page(['a'], token='tok1')
+        pages.responses[next_page(harvester, 'tok1')] = oai_page(['b'])
+
+        records = harvester.get_records(first_page(harvester), str(base.date.today() - base.timedelta(1)))
+
+        assert [
+            record.xpath('ns0:header/ns0:identifier/node()', namespaces=harvester.namespaces)[0]
+            for record in records
+        ] == ['a', 'b']
+
+    def test_harvested_documents_carry_their_record(self, pages):
+        harvester = TestPagedHarvester()
+        pages.responses[first_page(harvester)] = oai_page(['a', 'b'])
+
+        for doc in harvester.harvest():
+            assert doc.parsed.getparent() is None
+            assert doc.parsed.xpath('//ns0:identifier/node()', namespaces=harvester.namespaces) == [doc['docID']]
+
+    def test_records_are_not_carried_to_other_processes(self, pages, monkeypatch):
+        harvester = TestPagedHarvester()
+        pages.responses[first_page(harvester)] = oai_page(['a', 'b'])
+        monkeypatch.setattr(settings, 'CELERY_ALWAYS_EAGER', False)
+
+        docs = harvester.harvest()
+
+        assert [doc['docID'] for doc in docs] == ['a', 'b']
+        assert all(doc.parsed is None for doc in docs)
+
+    def test_normalize_reuses_parsed_record(self, monkeypatch):
+        raw = RawDocument({
+            'doc': str(TEST_OAI_DOC),
+            'source': 'TEST',
+            'filetype': 'XML',
+            'docID': '1'
+        }, parsed=etree.XML(TEST_OAI_DOC))
+        unpickled = pickle.loads(pickle.dumps(raw))
+        expected = self.harvester.normalize(unpickled).attributes
+
+        assert unpickled.parsed is not None
+        assert pickle.loads(pickle.dumps(raw)).parsed is None
+
+        monkeypatch.setattr(base.etree, 'XML', mock.Mock(side_effect=AssertionError('parsed twice')))
+
+        assert self.harvester.normalize(raw).attributes == expected
+        assert self.harvester.normalize(unpickled).attributes == expected
+
+
+class TestOAIPageReader(object):
+
+    def test_reads_records_and_token(self):
+        reader = OAIPageReader(oai_page(['a', 'b', 'c'], token='next'))
+
+        identifiers = [
+            record.findtext('{http://www.openarchives.org/OAI/2.0/}header/{http://www.openarchives.org/OAI/2.0/}identifier')
+            for record in reader
+        ]
+
+        assert identifiers == ['a', 'b', 'c']
+        assert reader.resumption_token == 'next'
+
+    def test_empty_token(self):
+        reader = OAIPageReader(oai_page(['a']))
+
+        assert len(list(reader)) == 1
+        assert reader.resumption_token is None
+
+    def test_frees_consumed_records(self):
+        records = iter(OAIPageReader(oai_page(['a', 'b', 'c'])))
+
+        first = next(records)
+        parent = first.getparent()
+        next(records)
+
+        assert len(first) == 0
+        assert first.getparent() is None
+        assert len(parent.findall('{http://www.openarchives.org/OAI/2.0/}record')) == 2
+
+    def test_accepts_file_like(self):
+        reader = OAIPageReader(BytesIO(oai_page(['a'], token='tok')))
+
+        assert len(list(reader)) == 1
+        assert reader.resumption_token == 'tok'
+
+
+@pytest.fixture
+def mock_checkpoints(monkeypatch):
+    mock_checkpoints = mock.Mock()
+    mock_checkpoints.load.return_value = None
+    monkeypatch.setattr(base, 'checkpoints', mock_checkpoints)
+    return mock_checkpoints
+
+
+class TestResumableHarvest(object):
+
+    def setup_method(self, method):
+        self.harvester = TestPagedHarvester()
+        self.start_date = str(base.date.today() - base.timedelta(1))
+
+    def test_commits_after_each_page(self, pages, mock_checkpoints):
+        pages.responses[first_page(self.harvester)] = oai_page(['a'], token='tok1')
+        pages.responses[next_page(self.harvester, 'tok1')] = oai_page(['b'])
+
+        result = list(self.harvester.harvest_pages(resumable=True))
+
+        assert [[doc['docID'] for doc in page] for page in result] == [['a'], ['b']]
+        mock_checkpoints.commit.assert_called_once_with('testpaged', self.start_date, 'tok1', 1, expires=None)
+        mock_checkpoints.clear.assert_called_once_with('testpaged')
+
+    def test_does_not_commit_unconsumed_page(self, pages, mock_checkpoints):
+        pages.responses[first_page(self.harvester)] = oai_page(['a'], token='tok1')
+
+        next(self.harvester.harvest_pages(resumable=True))
+
+        assert not mock_checkpoints.commit.called
+
+    def test_resumes_from_checkpoint(self, pages, mock_checkpoints):
+        mock_checkpoints.load.return_value = mock.Mock(page_count=4, resumption_token='tok4')
+        pages.responses[next_page(self.harvester, 'tok4')] = oai_page(['e'], token='tok5')
+        pages.responses[next_page(self.harvester, 'tok5')] = oai_page(['f'])
+
+        result = sum(self.harvester.harvest_pages(resumable=True), [])
+
+        assert [doc['docID'] for doc in result] == ['e', 'f']
+        mock_checkpoints.load.assert_called_once_with('testpaged', self.start_date)
+        mock_checkpoints.commit.assert_called_once_with('testpaged', self.start_date, 'tok5', 5, expires=None)
+
+    def test_restarts_on_bad_token(self, pages, mock_checkpoints):
+        mock_checkpoints.load.return_value = mock.Mock(page_count=4, resumption_token='tok4')
+        pages.responses[next_page(self.harvester, 'tok4')] = str(
+            '<OAI-PMH xmlns="http://www.openarchives.org/OAI/2.0/">'
+            '<error code="badResumptionToken">expired</error>'
+            '</OAI-PMH>'
+        )
+        pages.responses[first_page(self.harvester)] = oai_page(['a'])
+
+        result = sum(self.harvester.harvest_pages(resumable=True), [])
+
+        assert [doc['docID'] for doc in result] == ['a']
+        mock_checkpoints.clear.assert_called_once_with('testpaged')
+
+    def test_not_resumable_by_default(self, pages, mock_checkpoints):
+        pages.responses[first_page(self.harvester)] = oai_page(['a'], token='tok1')
+        pages.responses[next_page(self.harvester, 'tok1')] = oai_page(['b'])
+
+        self.harvester.harvest()
+
+        assert not mock_checkpoints.load.called
+        assert not mock_checkpoints.commit.called
+        assert not mock_checkpoints.clear.called
+
+
+class TestSlicedHarvest(object):
+
+    def setup_method(self, method):
+        self.harvester = TestPagedHarvester()
+        self.harvester.slice_days = 1
+        self.today = base.date.today()
+
+    def window(self, days_ago, open_ended=False):
+        from_date = self.today - base.timedelta(days_ago)
+        return self.harvester.window_url(from_date, None if open_ended else from_date)
+
+    def test_date_windows(self):
+        self.harvester.slice_days = 2
+        start = self.today - base.timedelta(4)
+
+        assert self.harvester.date_windows(start) == [
+            (start, start + base.timedelta(1)),
+            (start + base.timedelta(2), start + base.timedelta(3)),
+            (self.today, None),
+        ]
+
+    def test_window_url(self):
+        self.harvester.timezone_granularity = True
+
+        assert self.harvester.window_url('2015-01-01', '2015-01-02') == (
+            'http://test.org/oai?verb=ListRecords&metadataPrefix=oai_dc'
+            '&from=2015-01-01T00:00:00Z&until=2015-01-02T23:59:59Z'
+        )
+
+    def test_harvests_every_slice(self, pages):
+        pages.responses[self.window(2)] = oai_page(['a', 'b'], token='tok')
+        pages.responses[next_page(self.harvester, 'tok')] = oai_page(['c'])
+        pages.responses[self.window(1)] = oai_page(['d'])
+        pages.responses[self.window(0, open_ended=True)] = oai_page(['e'])
+
+        results = self.harvester.harvest(days_back=2)
+
+        assert sorted(doc['docID'] for doc in results) == ['a', 'b', 'c', 'd', 'e']
+        assert pages.call_count == 4
+
+    def test_deduplicates_keeping_newest(self, pages):
+        pages.responses[self.window(1)] = oai_page(['a', 'b'], datestamp='2015-03-01T00:00:00Z')
+        pages.responses[self.window(0, open_ended=True)] = oai_page(['b'], datestamp='2015-03-02T00:00:00Z')
+
+        results = self.harvester.harvest(days_back=1)
+
+        assert sorted(doc['docID'] for doc in results) == ['a', 'b']
+        assert '2015-03-02' in [doc for doc in results if doc['docID'] == 'b'][0]['doc']
+
+
+class TestSetHarvest(object):
+
+    def setup_method(self, method):
+        self.harvester = TestPagedHarvester()
+        self.harvester.harvest_by_set = True
+        self.harvester.approved_sets = ['one', 'two']
+        self.harvester.set_spec_prefix = 'publication:'
+        self.start_date = base.date.today() - base.timedelta(1)
+
+    def test_windows(self):
+        assert self.harvester.windows(self.start_date) == [
+            (self.start_date, None, 'publication:one'),
+            (self.start_date, None, 'publication:two'),
+        ]
+
+    def test_windows_with_slices(self):
+        self.harvester.slice_days = 1
+        today = base.date.today()
+
+        assert self.harvester.windows(self.start_date) == [
+            (self.start_date, self.start_date, 'publication:one'),
+            (self.start_date, self.start_date, 'publication:two'),
+            (today, None, 'publication:one'),
+            (today, None, 'publication:two'),
+        ]
+
+    def test_requests_each_set_and_deduplicates(self, pages):
+        pages.responses[first_page(self.harvester) + '&set=publication:one'] = oai_page(['a', 'b'], set_spec='publication:one')
+        pages.responses[first_page(self.harvester) + '&set=publication:two'] = oai_page(['b', 'c'], token='tok', set_spec='publication:two')
+        pages.responses[next_page(self.harvester, 'tok')] = oai_page(['d'], set_spec='publication:two')
+
+        results = self.harvester.harvest()
+
+        assert sorted(doc['docID'] for doc in results) == ['a', 'b', 'c', 'd']
+        assert pages.call_count == 3
+
+    def test_ignored_without_approved_sets(self, pages):
+        self.harvester.approved_sets = None
+        pages.responses[first_page(self.harvester)] = oai_page(['a'], set_spec='publication:one')
+
+        assert [doc['docID'] for doc in self.harvester.harvest()] == ['a']
+
+
+class TestRecordFilters(object):
+
+    def setup_method(self, method):
+        self.harvester = TestPagedHarvester()
+
+    def test_drops_deleted_and_unapproved(self, pages, monkeypatch):
+        mock_dispatch = mock.Mock()
+        monkeypatch.setattr(base.events, 'dispatch', mock_dispatch)
+        self.harvester.approved_sets = ['kept']
+        pages.responses[first_page(self.harvester)] = oai_page(['a', 'b'], set_spec='publication:kept', deleted=['b'], token='tok')
+        pages.responses[next_page(self.harvester, 'tok')] = oai_page(['c', 'd'], set_spec='publication:other')
+
+        results = self.harvester.harvest()
+
+        assert [doc['docID'] for doc in results] == ['a']
+        mock_dispatch.assert_called_once_with(
+            base.events.HARVEST_FILTER, base.events.COMPLETED,
+            harvester='testpaged', dropped={'deleted': 1, 'unapproved_set': 2}
+        )
+
+    def test_filters_are_pluggable(self, pages):
+        self.harvester.filter_deleted = lambda header: None
+        pages.responses[first_page(self.harvester)] = oai_page(['a', 'b'], deleted=['b'])
+
+        assert [doc['docID'] for doc in self.harvester.harvest()] == ['a', 'b']
+
+    def test_sliced_harvest_filters(self, pages):
+        self.harvester.slice_days = 1
+        today = base.date.today()
+        pages.responses[self.harvester.window_url(today - base.timedelta(1), today - base.timedelta(1))] = oai_page(['a', 'b'], deleted=['a'])
+        pages.responses[self.harvester.window_url(today)] = oai_page(['c'], deleted=['c'])
+
+        assert [doc['docID'] for doc in self.harvester.harvest()] == ['b']
+
+
+class TestDeltaHarvest(object):
+
+    def setup_method(self, method):
+        self.harvester = TestPagedHarvester()
+        self.harvester.delta_harvest = True
+        self.start_date = base.date.today() - base.timedelta(1)
+        self.list_url = self.harvester.window_url(self.start_date, identifiers=True)
+
+    def get_record(self, identifier):
+        return self.harvester.base_url + self.harvester.GET_RECORD_URL.format(identifier)
+
+    def test_fetches_only_changed_records(self, pages, monkeypatch):
+        monkeypatch.setattr(self.harvester, 'stored_dates', lambda identifiers: {
+            'oai:a': '2015-03-30T00:00:00+00:00',
+            'oai:b': '2015-03-01T00:00:00+00:00',
+        })
+        pages.responses[self.list_url] = oai_headers(['oai:a', 'oai:b', 'oai:c'], token='tok')
+        pages.responses[self.harvester.base_url + self.harvester.IDENTIFIERS_URL + '&resumptionToken=tok'] = oai_headers(['oai:d'], deleted=['oai:d'])
+        pages.responses[self.get_record('oai:b')] = oai_page(['oai:b'])
+        pages.responses[self.get_record('oai:c')] = oai_page(['oai:c'])
+
+        results = self.harvester.harvest()
+
+        assert sorted(doc['docID'] for doc in results) == ['oai:b', 'oai:c']
+        assert self.get_record('oai:a') not in [call[0][0] for call in pages.call_args_list]
+
+    def test_yields_a_page_per_identifier_page(self, pages, monkeypatch):
+        monkeypatch.setattr(self.harvester, 'stored_dates', lambda identifiers: {})
+        pages.responses[self.list_url] = oai_headers(['oai:a'], token='tok')
+        pages.responses[self.harvester.base_url + self.harvester.IDENTIFIERS_URL + '&resumptionToken=tok'] = oai_headers(['oai:b'])
+        pages.responses[self.get_record('oai:a')] = oai_page(['oai:a'])
+        pages.responses[self.get_record('oai:b')] = oai_page(['oai:b'])
+
+        result = list(self.harvester.harvest_pages())
+
+        assert [[doc['docID'] for doc in page] for page in result] == [['oai:a'], ['oai:b']]
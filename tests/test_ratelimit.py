@@ -0,0 +1,126 @@
+import mock
+import pytest
+
+from scrapi import ratelimit
+from scrapi.ratelimit import TokenBucket, RateLimiter
+
+
+@pytest.fixture(autouse=True)
+def rate_settings(monkeypatch):
+    monkeypatch.setattr(ratelimit.settings, 'RATE_LIMIT_MIN_RATIO', 0.25)
+    monkeypatch.setattr(ratelimit.settings, 'RATE_LIMIT_FAST_RESPONSE', 1.0)
+
+
+class TestTokenBucket(object):
+
+    def test_first_request_is_free(self):
+        bucket = TokenBucket(2)
+
+        assert bucket.reserve(bucket.updated) == 0
+
+    def test_queues_concurrent_requests(self):
+        bucket = TokenBucket(2)
+        now = bucket.updated
+
+        assert [bucket.reserve(now) for _ in range(3)] == [0, 2, 4]
+        assert bucket.max_wait == 4
+        assert bucket.total_wait == 6
+
+    def test_refills(self):
+        bucket = TokenBucket(2)
+        now = bucket.updated
+
+        bucket.reserve(now)
+
+        assert bucket.reserve(now + 1) == 1
+        assert bucket.reserve(now + 10) == 0
+
+    def test_speeds_up_on_fast_responses(self):
+        bucket = TokenBucket(2)
+
+        for _ in range(100):
+            bucket.feedback(0, 200, 0.1)
+
+        assert bucket.interval == 0.5
+
+    def test_slows_back_down(self):
+        bucket = TokenBucket(2)
+        bucket.interval = 1
+
+        for _ in range(100):
+            bucket.feedback(0, 200, 5)
+
+        assert bucket.interval == 2
+
+    def test_backs_off(self):
+        bucket = TokenBucket(2)
+        now = bucket.updated
+
+        bucket.feedback(now, 503, 0.1)
+
+        assert bucket.interval == 4
+        assert bucket.backoffs == 1
+        assert bucket.reserve(now) == 4
+
+    def test_honors_retry_after(self):
+        bucket = TokenBucket(2)
+        now = bucket.updated
+
+        bucket.feedback(now, 503, 0.1, retry_after=30)
+
+        assert bucket.interval == 30
+        assert bucket.reserve(now + 10) == 20
+
+    def test_recovers_after_backing_off(self):
+        bucket = TokenBucket(2)
+
+        bucket.feedback(0, 503, 0.1)
+        for _ in range(100):
+            bucket.feedback(0, 200, 5)
+
+        assert bucket.interval == 2
+
+    def test_recovers_after_retry_after(self):
+        bucket = TokenBucket(2)
+
+        bucket.feedback(0, 503, 0.1, retry_after=600)
+        for _ in range(100):
+            bucket.feedback(0, 200, 5)
+
+        assert bucket.interval == 2
+
+
+class TestRateLimiter(object):
+
+    def test_buckets_are_per_host(self):
+        limiter = RateLimiter()
+
+        assert limiter.reserve('http://a.org/oai', 10) == 0
+        assert limiter.reserve('http://b.org/oai', 10) == 0
+        assert limiter.reserve('http://a.org/other', 10) > 0
+
+    def test_feedback_reads_retry_after(self):
+        limiter = RateLimiter()
+        limiter.reserve('http://a.org/oai', 1)
+
+        retry_after = limiter.feedback('http://a.org/oai', mock.Mock(status_code=503, headers={'Retry-After': '20'}), 0.1)
+
+        assert retry_after == 20
+        assert limiter.stats()['a.org']['interval'] == 20
+
+    def test_other_throttles_keep_back_off(self):
+        limiter = RateLimiter()
+        limiter.reserve('http://a.org/oai', 1)
+        limiter.feedback('http://a.org/oai', mock.Mock(status_code=503, headers={}), 0.1)
+
+        limiter.reserve('http://a.org/oai', 0.5)
+        limiter.reserve('http://a.org/oai', 1.5)
+
+        assert limiter.stats()['a.org']['interval'] == 2
+        assert limiter._buckets['a.org'].base_interval == 1.5
+
+    def test_parse_retry_after(self):
+        assert ratelimit.parse_retry_after('120') == 120
+        assert ratelimit.parse_retry_after(None) is None
+        assert ratelimit.parse_retry_after('Wed, 21 Oct 2015 07:28:00 GMT') == 0
+        assert ratelimit.parse_retry_after('nonsense') is None
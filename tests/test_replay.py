@@ -0,0 +1,107 @@
+import os
+import mock
+import pytest
+
+from scrapi import replay
+from scrapi import requests
+
+
+@pytest.fixture
+def archive_path(tmpdir):
+    return str(tmpdir.join('archive'))
+
+
+@pytest.fixture
+def mock_requests(monkeypatch):
+    mock_req = mock.Mock()
+    mock_req.Session.return_value = mock_req
+    mock_req.request.return_value = mock.Mock(
+        ok=True, status_code=200, content='<a>rawr</a>', encoding='utf-8', headers={'tota': 'dyle'}
+    )
+    monkeypatch.setattr(requests, 'requests', mock_req)
+    monkeypatch.setattr(requests, '_sessions', {})
+    monkeypatch.setattr(requests.ratelimit, 'limiter', requests.ratelimit.RateLimiter())
+    return mock_req
+
+
+class TestReplayArchive(object):
+
+    def test_put_and_get(self, archive_path):
+        archive = replay.ReplayArchive(archive_path)
+        archive.put('get http://dinosaurs.sexy', {'content': 'rawr'})
+
+        assert 'get http://dinosaurs.sexy' in archive
+        assert archive.get('get http://dinosaurs.sexy') == {'content': 'rawr'}
+        assert archive.get('get http://other.place') is None
+
+    def test_later_entries_win(self, archive_path):
+        archive = replay.ReplayArchive(archive_path)
+        archive.put('key', 1)
+        archive.put('key', 2)
+
+        assert len(archive) == 1
+        assert archive.get('key') == 2
+
+    def test_reopens(self, archive_path):
+        archive = replay.ReplayArchive(archive_path)
+        archive.put('key', {'content': 'rawr'})
+        archive.close()
+
+        assert replay.ReplayArchive(archive_path).get('key') == {'content': 'rawr'}
+
+    def test_ignores_truncated_entries(self, archive_path):
+        archive = replay.ReplayArchive(archive_path)
+        archive.put('key', 'a' * 100)
+        archive.close()
+
+        with open(os.path.join(archive_path, archive.INDEX), 'a') as index:
+            index.write('["broken", 1000, 10]\n["half')
+
+        archive = replay.ReplayArchive(archive_path)
+        assert len(archive) == 1
+        assert archive.get('key') == 'a' * 100
+
+
+class TestReplayRequests(object):
+
+    def test_records_then_replays(self, archive_path, mock_requests):
+        with replay.archive(archive_path):
+            first = requests.get('http://dinosaurs.sexy')
+
+        with replay.archive(archive_path):
+            second = requests.get('http://dinosaurs.sexy')
+
+        assert mock_requests.request.call_count == 1
+        assert first.content == second.content == '<a>rawr</a>'
+        assert second.headers == {'tota': 'dyle'}
+        assert second.raw.read() == '<a>rawr</a>'
+
+    def test_offline_misses_raise(self, archive_path, mock_requests):
+        with replay.archive(archive_path, offline=True):
+            with pytest.raises(replay.ReplayMiss):
+                requests.get('http://dinosaurs.sexy')
+
+        assert not mock_requests.request.called
+
+    def test_streamed_responses_are_stored_whole(self, archive_path, mock_requests):
+        with replay.archive(archive_path):
+            requests.get('http://dinosaurs.sexy', stream=True)
+
+        with replay.archive(archive_path, offline=True):
+            resp = requests.get('http://dinosaurs.sexy', stream=True)
+
+        assert not resp.chunks
+        assert resp.raw.read() == '<a>rawr</a>'
+
+    def test_archive_is_restored(self, archive_path):
+        with replay.archive(archive_path) as archive:
+            assert replay.active() is archive
+        assert replay.active() is None
+
+    def test_archive_from_settings(self, archive_path, monkeypatch):
+        monkeypatch.setattr(replay, '_active', None)
+        monkeypatch.setattr(replay.settings, 'REPLAY_ARCHIVE', archive_path)
+        monkeypatch.setattr(replay.settings, 'REPLAY_OFFLINE', True)
+
+        assert replay.active().offline
+        assert replay.active().path == archive_path
@@ -1,14 +1,24 @@
 import mock
 import json
+import zlib
+import hashlib
+import time
 import pytest
+import threading
+from datetime import date, datetime
 
 from scrapi import requests
 
+_maybe_load_response = requests._maybe_load_response
+
 
 @pytest.fixture(autouse=True)
 def mock_requests(monkeypatch):
     mock_req = mock.Mock()
+    # Sessions make their requests through the mock as well
+    mock_req.Session.return_value = mock_req
     monkeypatch.setattr(requests, 'requests', mock_req)
+    monkeypatch.setattr(requests, '_sessions', {})
     return mock_req
 
 
@@ -17,6 +27,20 @@ def mock_record_transactions(monkeypatch):
     monkeypatch.setattr(requests.settings, 'RECORD_HTTP_TRANSACTIONS', True)
 
 
+@pytest.fixture(autouse=True)
+def limiter(monkeypatch):
+    limiter = requests.ratelimit.RateLimiter()
+    monkeypatch.setattr(requests.ratelimit, 'limiter', limiter)
+    return limiter
+
+
+@pytest.fixture(autouse=True)
+def response_cache(monkeypatch):
+    response_cache = requests.cache.TieredCache(requests.cache.MemoryCache(1024 * 1024, 60))
+    monkeypatch.setattr(requests.cache, '_responses', response_cache)
+    return response_cache
+
+
 class TestSettings(object):
 
     def test_record_or_load_response_respects_record_false(self, mock_requests, monkeypatch):
@@ -39,6 +63,752 @@ class TestSettings(object):
         assert mock_requests.request.called_once_with('get', 'foo')
 
 
+    def test_throttle_applies_without_recording(self, mock_requests, monkeypatch):
+        mock_sleep = mock.Mock()
+        monkeypatch.setattr(requests.time, 'sleep', mock_sleep)
+        monkeypatch.setattr(requests.settings, 'RECORD_HTTP_TRANSACTIONS', False)
+        mock_requests.request.return_value = mock.Mock(status_code=200)
+
+        requests.get('http://dinosaurs.sexy', throttle=2, force=True)
+        requests.get('http://dinosaurs.sexy', throttle=2, force=True)
+
+        assert mock_sleep.call_count == 1
+        assert mock_sleep.call_args[0][0] > 0
+        mock_requests.request.assert_called_with('get', 'http://dinosaurs.sexy')
+
+
+class TestSessions(object):
+
+    def test_sessions_are_per_host(self, mock_requests):
+        mock_requests.Session.side_effect = lambda: mock.Mock()
+
+        session = requests._session('http://dinosaurs.sexy/a')
+
+        assert requests._session('http://dinosaurs.sexy/b') is session
+        assert requests._session('https://dinosaurs.sexy/a') is not session
+        assert requests._session('http://other.host/a') is not session
+
+    def test_pool_size_is_configurable(self, mock_requests, monkeypatch):
+        monkeypatch.setattr(requests.settings, 'HTTP_POOL_SIZES', {'big.host': 32})
+
+        requests._session('http://big.host/a')
+        requests._session('http://small.host/a')
+
+        assert mock_requests.adapters.HTTPAdapter.call_args_list == [
+            mock.call(pool_connections=1, pool_maxsize=32),
+            mock.call(pool_connections=1, pool_maxsize=requests.settings.HTTP_POOL_MAXSIZE),
+        ]
+
+    def test_sessions_are_dropped_after_fork(self, mock_requests, monkeypatch):
+        mock_requests.Session.side_effect = lambda: mock.Mock()
+        session = requests._session('http://dinosaurs.sexy/a')
+
+        monkeypatch.setattr(requests.os, 'getpid', lambda: -1)
+
+        assert requests._session('http://dinosaurs.sexy/a') is not session
+
+
+class TestFetchAll(object):
+
+    def test_yields_every_response(self, monkeypatch):
+        monkeypatch.setattr(requests, 'request', lambda method, url, **kwargs: (method, url, kwargs))
+
+        results = dict(requests.fetch_all(['http://a.org/{}'.format(x) for x in range(20)], params={'x': 1}))
+
+        assert len(results) == 20
+        assert results['http://a.org/3'] == ('get', 'http://a.org/3', {'params': {'x': 1}})
+
+    def test_limits_requests_per_host(self, monkeypatch):
+        in_flight, peak = {}, {}
+        lock = requests.threading.Lock()
+
+        def slow_request(method, url, **kwargs):
+            host = url.split('/')[2]
+            with lock:
+                in_flight[host] = in_flight.get(host, 0) + 1
+                peak[host] = max(peak.get(host, 0), in_flight[host])
+            time.sleep(0.01)
+            with lock:
+                in_flight[host] -= 1
+
+        monkeypatch.setattr(requests, 'request', slow_request)
+        urls = ['http://{}.org/{}'.format(host, x) for host in 'ab' for x in range(10)]
+
+        list(requests.fetch_all(urls, workers=8, per_host=2))
+
+        assert peak == {'a.org': 2, 'b.org': 2}
+
+    def test_retries_then_skips_connection_errors(self, monkeypatch):
+        attempts = []
+
+        def flaky_request(method, url, **kwargs):
+            attempts.append(url)
+            if url.endswith('bad') or attempts.count(url) == 1:
+                raise requests.exceptions.ConnectionError('nope')
+            return 'ok'
+
+        monkeypatch.setattr(requests, 'request', flaky_request)
+
+        results = list(requests.fetch_all(['http://a.org/good', 'http://a.org/bad'], retries=2))
+
+        assert results == [('http://a.org/good', 'ok')]
+        assert attempts.count('http://a.org/good') == 2
+        assert attempts.count('http://a.org/bad') == 3
+
+    def test_no_urls(self):
+        assert list(requests.fetch_all([])) == []
+
+
+class TestSingleFlight(object):
+
+    def run_concurrently(self, flight, func, count=3):
+        started, release = threading.Event(), threading.Event()
+        results, errors = [], []
+
+        def leader_func():
+            started.set()
+            release.wait()
+            return func()
+
+        def call(target):
+            try:
+                results.append(flight.do('key', target))
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=call, args=(leader_func, ))]
+        threads[0].start()
+        started.wait()
+
+        threads.extend(threading.Thread(target=call, args=(func, )) for _ in range(count - 1))
+        for thread in threads[1:]:
+            thread.start()
+        time.sleep(0.1)
+
+        release.set()
+        for thread in threads:
+            thread.join()
+        return results, errors
+
+    def test_collapses_concurrent_calls(self):
+        func = mock.Mock(return_value='rawr')
+
+        results, errors = self.run_concurrently(requests.SingleFlight(), func)
+
+        assert func.call_count == 1
+        assert results == ['rawr'] * 3
+        assert not errors
+
+    def test_errors_are_shared(self):
+        func = mock.Mock(side_effect=ValueError('rawr'))
+
+        results, errors = self.run_concurrently(requests.SingleFlight(), func)
+
+        assert func.call_count == 1
+        assert not results
+        assert len(errors) == 3
+        assert all(isinstance(e, ValueError) for e in errors)
+
+    def test_later_calls_are_made_again(self):
+        flight, func = requests.SingleFlight(), mock.Mock(return_value='rawr')
+
+        flight.do('key', func)
+        flight.do('key', func)
+
+        assert func.call_count == 2
+
+    def test_keys(self, monkeypatch):
+        key = requests._flight_key
+
+        assert key('get', 'foo', {'params': {'a': 1, 'b': 2}, 'throttle': 5}) == key('get', 'foo', {'params': {'b': 2, 'a': 1}})
+        assert key('get', 'foo', {'force': True}) != key('get', 'foo', {})
+        assert key('get', 'foo', {}) != key('post', 'foo', {})
+        assert key('post', 'foo', {'data': 'rawr'}) is None
+
+        monkeypatch.setattr(requests.settings, 'RECORD_HTTP_TRANSACTIONS', False)
+        assert key('get', 'foo', {'stream': True}) is None
+
+    def test_requests_are_collapsed(self, monkeypatch):
+        mock_flight = mock.Mock()
+        monkeypatch.setattr(requests, '_in_flight', mock_flight)
+
+        requests.get('foo', params={'a': 1})
+
+        mock_flight.do.assert_called_once_with(
+            ('get', 'foo', ('params', (('a', 1), ))), requests._request, 'get', 'foo', params={'a': 1}
+        )
+
+    def test_can_be_disabled(self, monkeypatch):
+        mock_flight = mock.Mock()
+        monkeypatch.setattr(requests, '_in_flight', mock_flight)
+        monkeypatch.setattr(requests, 'record_or_load_response', mock.Mock())
+        monkeypatch.setattr(requests.settings, 'SINGLE_FLIGHT_REQUESTS', False)
+
+        requests.get('foo')
+
+        assert not mock_flight.do.called
+        assert requests.record_or_load_response.called
+
+
+class TestMetrics(object):
+
+    def test_requests_are_measured(self, mock_requests, monkeypatch):
+        monkeypatch.setattr(requests.settings, 'HTTP_METRICS', True)
+        monkeypatch.setattr(requests.settings, 'RECORD_HTTP_TRANSACTIONS', False)
+        monkeypatch.setattr(requests.metrics, '_metrics', requests.metrics.Metrics())
+        mock_requests.request.return_value = mock.Mock(status_code=200, content='rawr')
+
+        with requests.metrics.harvesting('test'):
+            requests.get('http://dinosaurs.sexy')
+
+        stats = requests.http_stats('test')['dinosaurs.sexy']
+        assert stats['requests'] == 1
+        assert stats['bytes'] == 4
+        assert stats['throttle']['count'] == 1
+
+
+class TestRateLimiting(object):
+
+    def test_retries_when_asked_to_back_off(self, mock_requests, monkeypatch):
+        mock_sleep = mock.Mock()
+        monkeypatch.setattr(requests.time, 'sleep', mock_sleep)
+        mock_requests.request.side_effect = [
+            mock.Mock(status_code=503, headers={'Retry-After': '5'}),
+            mock.Mock(status_code=200, headers={}),
+        ]
+
+        resp = requests._send('get', 'http://export.arxiv.org/oai2')
+
+        assert resp.status_code == 200
+        assert mock_requests.request.call_count == 2
+        assert 4 < mock_sleep.call_args[0][0] <= 5
+
+    def test_gives_up_after_retries(self, mock_requests, monkeypatch):
+        monkeypatch.setattr(requests.time, 'sleep', mock.Mock())
+        monkeypatch.setattr(requests.settings, 'RATE_LIMIT_RETRIES', 2)
+        mock_requests.request.return_value = mock.Mock(status_code=503, headers={})
+
+        resp = requests._send('get', 'http://export.arxiv.org/oai2')
+
+        assert resp.status_code == 503
+        assert mock_requests.request.call_count == 3
+
+    def test_stats_are_exposed(self, mock_requests, monkeypatch):
+        monkeypatch.setattr(requests.time, 'sleep', mock.Mock())
+        mock_requests.request.return_value = mock.Mock(status_code=200, headers={})
+
+        requests._send('get', 'http://export.arxiv.org/oai2', throttle=30)
+
+        stats = requests.rate_limit_stats()
+        assert stats['export.arxiv.org']['requests'] == 1
+
+
+class TestResponseCache(object):
+
+    def test_loads_go_through_the_cache(self, monkeypatch):
+        stored = requests.HarvesterResponse(method='get', url='http://dinosaurs.sexy', ok=True, content='rawr')
+        mock_get = mock.Mock(return_value=stored)
+        monkeypatch.setattr(requests.HarvesterResponse, 'get', mock_get)
+
+        first = requests._maybe_load_response('get', 'http://dinosaurs.sexy')
+        second = requests._maybe_load_response('get', 'http://dinosaurs.sexy')
+
+        assert mock_get.call_count == 1
+        assert first.content == second.content == 'rawr'
+        assert second._is_persisted
+
+    def test_misses_are_not_cached(self, monkeypatch):
+        mock_get = mock.Mock(side_effect=requests.HarvesterResponse.DoesNotExist)
+        monkeypatch.setattr(requests.HarvesterResponse, 'get', mock_get)
+        monkeypatch.setattr(requests.settings, 'READ_LEGACY_RESPONSES', False)
+
+        assert requests._maybe_load_response('get', 'http://dinosaurs.sexy') is None
+        assert requests._maybe_load_response('get', 'http://dinosaurs.sexy') is None
+        assert mock_get.call_count == 2
+
+    def test_recorded_responses_are_cached(self, mock_requests, monkeypatch):
+        monkeypatch.setattr(requests, '_maybe_load_response', lambda *_, **__: None)
+        monkeypatch.setattr(requests.HarvesterResponse, 'save', lambda self: self)
+        mock_requests.request.return_value = mock.Mock(
+            ok=True, content='rawr', encoding='utf-8', status_code=200, headers={}
+        )
+
+        requests.get('http://dinosaurs.sexy/')
+
+        cached = requests.cache.responses().get(requests._cache_key('get', 'http://dinosaurs.sexy/'))
+        assert requests.HarvesterResponse._construct_instance(cached).content == 'rawr'
+
+
+class TestPartitioning(object):
+
+    def test_partition_keys_come_from_url(self):
+        resp = requests.HarvesterResponse(method='get', url='http://dinosaurs.sexy/rawr?a=b')
+
+        assert resp.host == 'dinosaurs.sexy'
+        assert resp.url_hash == hashlib.sha1('http://dinosaurs.sexy/rawr?a=b').hexdigest()
+
+    def test_get_fills_in_partition_keys(self, monkeypatch):
+        mock_get = mock.Mock()
+        monkeypatch.setattr(requests.cqlengine.Model, 'get', classmethod(lambda cls, **kwargs: mock_get(**kwargs)))
+
+        requests.HarvesterResponse.get(method='get', url='http://dinosaurs.sexy')
+
+        mock_get.assert_called_once_with(
+            method='get',
+            url='http://dinosaurs.sexy',
+            host='dinosaurs.sexy',
+            url_hash=hashlib.sha1('http://dinosaurs.sexy').hexdigest()
+        )
+
+    def test_falls_back_to_legacy_table(self, monkeypatch):
+        legacy = requests.LegacyHarvesterResponse(method='get', url='http://dinosaurs.sexy', ok=True, content='rawr')
+        monkeypatch.setattr(requests.HarvesterResponse, 'get', mock.Mock(side_effect=requests.HarvesterResponse.DoesNotExist))
+        monkeypatch.setattr(requests.LegacyHarvesterResponse, 'get', mock.Mock(return_value=legacy))
+        monkeypatch.setattr(requests.HarvesterResponse, 'save', lambda self: self)
+        monkeypatch.setattr(requests.settings, 'READ_LEGACY_RESPONSES', True)
+
+        resp = requests._maybe_load_response('get', 'http://dinosaurs.sexy')
+
+        assert isinstance(resp, requests.HarvesterResponse)
+        assert resp.host == 'dinosaurs.sexy'
+        assert resp.content == 'rawr'
+        assert resp.ok
+
+    def test_legacy_table_is_not_read_by_default(self, monkeypatch):
+        mock_legacy_get = mock.Mock()
+        monkeypatch.setattr(requests.HarvesterResponse, 'get', mock.Mock(side_effect=requests.HarvesterResponse.DoesNotExist))
+        monkeypatch.setattr(requests.LegacyHarvesterResponse, 'get', mock_legacy_get)
+
+        assert requests._maybe_load_response('get', 'http://dinosaurs.sexy') is None
+        assert not mock_legacy_get.called
+
+
+class TestCompression(object):
+
+    def test_content_is_compressed(self):
+        resp = requests.HarvesterResponse(method='get', url='http://dinosaurs.sexy', content='rawr' * 100)
+
+        assert resp.codec == 'zlib'
+        assert resp.body == zlib.compress('rawr' * 100)
+        assert resp.content == 'rawr' * 100
+
+    def test_uncompressed_rows_still_read(self):
+        resp = requests.HarvesterResponse._construct_instance({
+            'method': 'get', 'url': 'http://dinosaurs.sexy', 'body': '{"rawr": 1}', 'codec': None
+        })
+
+        assert resp.content == '{"rawr": 1}'
+        assert resp.text == u'{"rawr": 1}'
+        assert resp.json() == {'rawr': 1}
+
+    def test_compression_can_be_disabled(self, monkeypatch):
+        monkeypatch.setattr(requests.settings, 'RESPONSE_CODEC', None)
+
+        resp = requests.HarvesterResponse(method='get', url='http://dinosaurs.sexy', content='rawr')
+
+        assert resp.codec is None
+        assert resp.body == 'rawr'
+
+    def test_setting_content_recompresses(self):
+        resp = requests.HarvesterResponse(method='get', url='http://dinosaurs.sexy', content='rawr')
+        assert resp.content == 'rawr'
+
+        resp.content = 'roar'
+
+        assert resp.content == 'roar'
+        assert zlib.decompress(resp.body) == 'roar'
+
+
+class TestStreaming(object):
+
+    @pytest.fixture
+    def chunks(self, monkeypatch):
+        stored = {}
+
+        def save(self):
+            stored[(self.url, self.index)] = self
+            return self
+
+        class Query(object):
+            def __init__(self, url):
+                self.url, self.start, self.stop, self.count = url, 0, 0, 0
+
+            def filter(self, index__gte, index__lt):
+                self.start, self.stop = index__gte, index__lt
+                return self
+
+            def limit(self, count):
+                self.count = count
+                return self
+
+            def __iter__(self):
+                indices = range(self.start, self.stop)[:self.count]
+                return iter([stored[(self.url, i)] for i in indices if (self.url, i) in stored])
+
+        monkeypatch.setattr(requests.HarvesterResponseChunk, 'save', save)
+        monkeypatch.setattr(requests.HarvesterResponseChunk, 'objects', staticmethod(lambda **kwargs: Query(kwargs['url'])))
+        monkeypatch.setattr(requests.settings, 'RESPONSE_CHUNK_PAGE', 2)
+        monkeypatch.setattr(requests.settings, 'RESPONSE_CHUNK_SIZE', 4)
+        return stored
+
+    @pytest.fixture
+    def streamed(self, mock_requests, monkeypatch):
+        monkeypatch.setattr(requests, '_maybe_load_response', lambda *_, **__: None)
+        monkeypatch.setattr(requests.HarvesterResponse, 'save', lambda self: self)
+        mock_requests.request.return_value = mock.Mock(
+            ok=True, status_code=200, encoding='utf-8', headers={},
+            iter_content=mock.Mock(return_value=iter(['<a>', 'rawr', '</a>']))
+        )
+        return mock_requests.request.return_value
+
+    def test_streamed_bodies_are_stored_in_chunks(self, chunks, streamed):
+        resp = requests.get('http://dinosaurs.sexy/', stream=True)
+        resp.raw.read()
+
+        assert resp.chunks == 3
+        assert resp.body is None
+        assert [zlib.decompress(chunks[('http://dinosaurs.sexy/', i)].data) for i in range(3)] == ['<a>', 'rawr', '</a>']
+        assert not streamed.content.called
+
+    def test_chunks_read_back(self, chunks, streamed):
+        resp = requests.get('http://dinosaurs.sexy', stream=True)
+
+        assert list(resp.iter_chunks()) == ['<a>', 'rawr', '</a>']
+        assert resp.content == '<a>rawr</a>'
+        assert resp.raw.read() == '<a>rawr</a>'
+
+    def test_chunks_are_read_while_recorded(self, chunks, streamed, monkeypatch):
+        monkeypatch.setattr(requests.HarvesterResponseChunk, 'objects', mock.Mock())
+        saved = []
+        monkeypatch.setattr(requests.HarvesterResponse, 'save', lambda self: saved.append(self) or self)
+
+        resp = requests.get('http://dinosaurs.sexy/', stream=True)
+        reader = resp.raw
+
+        assert reader.read(3) == '<a>'
+        assert not chunks
+
+        assert reader.read(4) == 'rawr'
+        assert sorted(chunks) == [('http://dinosaurs.sexy/', 0), ('http://dinosaurs.sexy/', 1)]
+        assert not saved
+
+        assert reader.read() == '</a>'
+        assert len(chunks) == 3
+        assert saved == [resp] and resp.chunks == 3
+        assert not requests.HarvesterResponseChunk.objects.called
+
+    def test_small_bodies_are_stored_inline(self, chunks, streamed, monkeypatch):
+        monkeypatch.setattr(requests.settings, 'RESPONSE_CHUNK_SIZE', 1024)
+
+        resp = requests.get('http://dinosaurs.sexy/', stream=True)
+        resp.raw.read()
+
+        assert not chunks
+        assert resp.chunks is None
+        assert resp.body == zlib.compress('<a>rawr</a>')
+
+    def test_small_bodies_are_served_from_the_cache(self, chunks, streamed, mock_requests, monkeypatch):
+        monkeypatch.setattr(requests.settings, 'RESPONSE_CHUNK_SIZE', 1024)
+        requests.get('http://dinosaurs.sexy/', stream=True).raw.read()
+
+        mock_requests.request.side_effect = AssertionError('made the request')
+        monkeypatch.setattr(requests, '_maybe_load_response', _maybe_load_response)
+        monkeypatch.setattr(requests.HarvesterResponse, 'get', mock.Mock(side_effect=AssertionError('read the row')))
+        monkeypatch.setattr(requests.HarvesterResponseChunk, 'objects', mock.Mock(side_effect=AssertionError('read a chunk')))
+
+        assert requests.get('http://dinosaurs.sexy/', stream=True).raw.read() == '<a>rawr</a>'
+
+    def test_unfinished_bodies_are_not_recorded(self, chunks, streamed, monkeypatch):
+        saved = []
+        monkeypatch.setattr(requests.HarvesterResponse, 'save', lambda self: saved.append(self) or self)
+
+        requests.get('http://dinosaurs.sexy/', stream=True).raw.read(3)
+
+        assert not saved
+
+    def test_missing_chunks_raise(self, chunks, streamed):
+        resp = requests.get('http://dinosaurs.sexy/', stream=True)
+        resp.raw.read()
+        del chunks[('http://dinosaurs.sexy/', 2)]
+
+        with pytest.raises(IOError):
+            resp.raw.read()
+
+    def test_unstreamed_responses_are_file_like(self):
+        resp = requests.HarvesterResponse(method='get', url='http://dinosaurs.sexy', content='<a>rawr</a>')
+
+        assert resp.raw.read() == '<a>rawr</a>'
+
+    def test_chunked_reader(self):
+        reader = requests.ChunkedReader(['ab', 'cde', 'f'])
+
+        assert reader.read(1) == 'a'
+        assert reader.read(3) == 'bcd'
+        assert reader.read() == 'ef'
+        assert reader.read(1) == ''
+
+    def test_raw_is_decoded_without_recording(self, mock_requests, monkeypatch):
+        monkeypatch.setattr(requests.settings, 'RECORD_HTTP_TRANSACTIONS', False)
+        mock_requests.request.return_value = mock.Mock(status_code=200)
+
+        resp = requests.get('http://dinosaurs.sexy', stream=True)
+
+        assert resp.raw.decode_content is True
+
+
+class TestCanonicalUrls(object):
+
+    def test_canonical_url(self):
+        canonical = requests.canonical_url
+
+        assert canonical('HTTP://Dinosaurs.SEXY:80') == 'http://dinosaurs.sexy/'
+        assert canonical('https://dinosaurs.sexy:443/a#b') == 'https://dinosaurs.sexy/a'
+        assert canonical('https://dinosaurs.sexy:8443/a') == 'https://dinosaurs.sexy:8443/a'
+        assert canonical('http://dinosaurs.sexy/a?z=1&a=2&b=3&a=1') == 'http://dinosaurs.sexy/a?a=2&a=1&b=3&z=1'
+        assert canonical('dinosaurs.sexy') == 'dinosaurs.sexy'
+
+    def test_reordered_params_share_a_key(self):
+        canonical = requests.canonical_url
+
+        spliced = 'http://test.org/oai?verb=ListRecords&metadataPrefix=oai_dc&from=2015-01-01'
+        built = 'http://test.org/oai?from=2015-01-01&verb=ListRecords&metadataPrefix=oai_dc'
+        assert canonical(spliced) == canonical(built)
+
+    def test_requests_load_canonical_keys(self, monkeypatch):
+        mock_load = mock.Mock(return_value=mock.Mock(ok=True))
+        monkeypatch.setattr(requests, '_maybe_load_response', mock_load)
+
+        requests.get('http://Dinosaurs.sexy/?b=1&a=2')
+
+        mock_load.assert_called_once_with(
+            'get', 'http://dinosaurs.sexy/?a=2&b=1', original_url='http://Dinosaurs.sexy/?b=1&a=2'
+        )
+
+    def test_old_keys_are_moved(self, monkeypatch):
+        stored = requests.HarvesterResponse(method='get', url='http://dinosaurs.sexy', ok=True, content='rawr')
+        saved = []
+
+        def get(url, method):
+            if url == 'http://dinosaurs.sexy':
+                return stored
+            raise requests.HarvesterResponse.DoesNotExist
+
+        monkeypatch.setattr(requests.HarvesterResponse, 'get', mock.Mock(side_effect=get))
+        monkeypatch.setattr(requests.HarvesterResponse, 'save', lambda self: saved.append(self) or self)
+        monkeypatch.setattr(requests.settings, 'READ_LEGACY_RESPONSES', False)
+        monkeypatch.setattr(requests.settings, 'READ_UNCANONICAL_RESPONSES', True)
+
+        resp = requests._maybe_load_response('get', 'http://dinosaurs.sexy/', original_url='http://dinosaurs.sexy')
+
+        assert resp.url == 'http://dinosaurs.sexy/'
+        assert resp.url_hash == hashlib.sha1('http://dinosaurs.sexy/').hexdigest()
+        assert resp.content == 'rawr'
+        assert saved == [resp]
+
+    def test_old_keys_are_not_read_by_default(self, monkeypatch):
+        mock_get = mock.Mock(side_effect=requests.HarvesterResponse.DoesNotExist)
+        monkeypatch.setattr(requests.HarvesterResponse, 'get', mock_get)
+
+        assert requests._maybe_load_response('get', 'http://dinosaurs.sexy/', original_url='http://dinosaurs.sexy') is None
+        assert mock_get.call_count == 1
+
+    def test_legacy_rows_are_saved_once(self, monkeypatch):
+        legacy = requests.LegacyHarvesterResponse(method='get', url='http://dinosaurs.sexy', ok=True, content='rawr')
+        saved = []
+
+        def legacy_get(url, method):
+            if url == 'http://dinosaurs.sexy':
+                return legacy
+            raise requests.LegacyHarvesterResponse.DoesNotExist
+
+        monkeypatch.setattr(requests.HarvesterResponse, 'get', mock.Mock(side_effect=requests.HarvesterResponse.DoesNotExist))
+        monkeypatch.setattr(requests.LegacyHarvesterResponse, 'get', mock.Mock(side_effect=legacy_get))
+        monkeypatch.setattr(requests.HarvesterResponse, 'save', lambda self: saved.append(self) or self)
+        monkeypatch.setattr(requests.settings, 'READ_LEGACY_RESPONSES', True)
+        monkeypatch.setattr(requests.settings, 'READ_UNCANONICAL_RESPONSES', True)
+
+        resp = requests._maybe_load_response('get', 'http://dinosaurs.sexy/', original_url='http://dinosaurs.sexy')
+
+        assert resp.url == 'http://dinosaurs.sexy/'
+        assert saved == [resp]
+
+    def test_legacy_rows_are_read_by_requested_url(self, monkeypatch):
+        original = 'http://dinosaurs.sexy/oai?verb=ListRecords&metadataPrefix=oai_dc&from=2015-01-01'
+        legacy = requests.LegacyHarvesterResponse(method='get', url=original, ok=True, content='rawr')
+        saved = []
+
+        def legacy_get(url, method):
+            if url == original:
+                return legacy
+            raise requests.LegacyHarvesterResponse.DoesNotExist
+
+        monkeypatch.setattr(requests.HarvesterResponse, 'get', mock.Mock(side_effect=requests.HarvesterResponse.DoesNotExist))
+        monkeypatch.setattr(requests.LegacyHarvesterResponse, 'get', mock.Mock(side_effect=legacy_get))
+        monkeypatch.setattr(requests.HarvesterResponse, 'save', lambda self: saved.append(self) or self)
+        monkeypatch.setattr(requests.settings, 'READ_LEGACY_RESPONSES', True)
+
+        resp = requests._maybe_load_response('get', requests.canonical_url(original), original_url=original)
+
+        assert resp.content == 'rawr'
+        assert resp.url == 'http://dinosaurs.sexy/oai?from=2015-01-01&metadataPrefix=oai_dc&verb=ListRecords'
+        assert saved == [resp]
+
+
+class TestPrefetch(object):
+
+    @pytest.fixture
+    def recorded(self, monkeypatch):
+        responses = [
+            requests.HarvesterResponse(method='get', url='http://dinosaurs.sexy/{}'.format(i), ok=True, content=str(i))
+            for i in range(5)
+        ] + [requests.HarvesterResponse(method='get', url='http://other.place/', ok=True, content='other')]
+        chunked = requests.HarvesterResponse(
+            method='get', url='http://other.place/big', ok=True, body=None, codec='zlib', chunks=2, time_made=datetime(2015, 6, 2)
+        )
+        chunks = [
+            mock.Mock(host=chunked.host, url_hash=chunked.url_hash, method='get', url=chunked.url, index=index, data=zlib.compress(data))
+            for index, data in enumerate(['<a>', '</a>'])
+        ]
+        days = {'2015-06-01': responses[:3], '2015-06-02': responses[3:] + [chunked], '2015-06-03': responses[2:4]}
+        responses.append(chunked)
+        queries = []
+
+        def index(harvester, day):
+            entries = [mock.Mock(host=resp.host, url_hash=resp.url_hash) for resp in days.get(day, [])]
+            return mock.Mock(limit=mock.Mock(return_value=entries if harvester == 'test' else []))
+
+        def load(host, url_hash__in):
+            queries.append((host, url_hash__in))
+            found = [resp for resp in responses if resp.host == host and resp.url_hash in url_hash__in]
+            return mock.Mock(limit=mock.Mock(return_value=found))
+
+        monkeypatch.setattr(requests.RecordedResponseIndex, 'objects', staticmethod(index))
+        def load_chunks(host, url_hash__in):
+            found = [chunk for chunk in chunks if chunk.host == host and chunk.url_hash in url_hash__in]
+            return mock.Mock(limit=mock.Mock(return_value=found))
+
+        monkeypatch.setattr(requests.HarvesterResponse, 'objects', staticmethod(load))
+        monkeypatch.setattr(requests.HarvesterResponseChunk, 'objects', staticmethod(load_chunks))
+        monkeypatch.setattr(requests.settings, 'PREFETCH_BATCH_SIZE', 2)
+        return mock.Mock(responses=responses, queries=queries, chunked=chunked)
+
+    def test_loads_responses_into_the_cache(self, recorded):
+        count = requests.prefetch('test', date(2015, 6, 1), date(2015, 6, 3))
+
+        assert count == 7
+        for resp in recorded.responses:
+            assert requests.cache.responses().get(requests._cache_key('get', resp.url)) is not None
+
+    def test_batches_by_host(self, recorded):
+        requests.prefetch('test', date(2015, 6, 1), date(2015, 6, 3))
+
+        assert sorted(len(hashes) for _, hashes in recorded.queries) == [1, 2, 2, 2]
+        assert {host for host, _ in recorded.queries} == {'dinosaurs.sexy', 'other.place'}
+
+    def test_only_reads_the_window(self, recorded):
+        assert requests.prefetch('test', date(2015, 6, 1), date(2015, 6, 1)) == 3
+
+    def test_chunked_bodies_replay_from_the_cache(self, recorded, mock_requests, monkeypatch):
+        requests.prefetch('test', date(2015, 6, 1), date(2015, 6, 3))
+
+        mock_requests.request.side_effect = AssertionError('made the request')
+        monkeypatch.setattr(requests.HarvesterResponse, 'get', mock.Mock(side_effect=AssertionError('read the row')))
+        monkeypatch.setattr(requests.HarvesterResponseChunk, 'objects', mock.Mock(side_effect=AssertionError('read a chunk')))
+
+        assert requests.get('http://other.place/big', stream=True).raw.read() == '<a></a>'
+
+    def test_counts_chunk_bytes(self, recorded, monkeypatch):
+        warning = mock.Mock()
+        monkeypatch.setattr(requests.logger, 'warning', warning)
+        rows = sum(requests.cache.byte_size(dict(resp)) for resp in recorded.responses[3:])
+        monkeypatch.setattr(requests.settings, 'RESPONSE_CACHE_BYTES', rows)
+
+        requests.prefetch('test', date(2015, 6, 2), date(2015, 6, 2))
+
+        assert warning.called
+        assert requests.prefetch('other', date(2015, 6, 1), date(2015, 6, 3)) == 0
+
+    def test_recorded_responses_are_indexed(self, monkeypatch):
+        indexed = []
+        monkeypatch.setattr(requests.HarvesterResponse, 'save', lambda self: self)
+        monkeypatch.setattr(requests.RecordedResponseIndex, 'save', lambda self: indexed.append(self))
+        resp = requests.HarvesterResponse(method='get', url='http://dinosaurs.sexy/', time_made=datetime(2015, 6, 1, 12))
+
+        requests._save_response(resp)
+        with requests.metrics.harvesting('test'):
+            requests._save_response(resp)
+
+        assert len(indexed) == 1
+        assert indexed[0].harvester == 'test'
+        assert indexed[0].day == '2015-06-01'
+        assert indexed[0].url_hash == resp.url_hash
+
+
+class TestConditionalRequests(object):
+
+    @pytest.fixture
+    def recorded(self, monkeypatch):
+        recorded = requests.HarvesterResponse(
+            ok=True, method='get', url='http://dinosaurs.sexy', content='rawr', status_code=200,
+            headers_str=json.dumps({'ETag': '"abc"', 'Last-Modified': 'Wed, 21 Oct 2015 07:28:00 GMT'})
+        )
+        def update(self, **kwargs):
+            for key, value in kwargs.items():
+                setattr(self, key, value)
+            return self
+
+        monkeypatch.setattr(requests, '_maybe_load_response', lambda *_, **__: recorded)
+        monkeypatch.setattr(requests.HarvesterResponse, 'save', lambda self: self)
+        monkeypatch.setattr(requests.HarvesterResponse, 'update', update)
+        return recorded
+
+    def test_sends_validators(self, mock_requests, recorded):
+        mock_requests.request.return_value = mock.Mock(status_code=304)
+
+        requests.get('http://dinosaurs.sexy', force=True)
+
+        mock_requests.request.assert_called_once_with('get', 'http://dinosaurs.sexy', headers={
+            'If-None-Match': '"abc"',
+            'If-Modified-Since': 'Wed, 21 Oct 2015 07:28:00 GMT',
+        })
+
+    def test_not_modified_returns_recorded(self, mock_requests, recorded):
+        mock_requests.request.return_value = mock.Mock(status_code=304)
+
+        resp = requests.get('http://dinosaurs.sexy', force=True)
+
+        assert resp is recorded
+        assert resp.content == 'rawr'
+        assert resp.time_made is not None
+
+    def test_modified_replaces_recorded(self, mock_requests, recorded):
+        mock_requests.request.return_value = mock.Mock(
+            ok=True, status_code=200, content='roar', encoding='utf-8', headers={'ETag': '"def"'}
+        )
+
+        resp = requests.get('http://dinosaurs.sexy', force=True)
+
+        assert resp.content == 'roar'
+        assert resp.headers['ETag'] == '"def"'
+
+    def test_caller_headers_win(self, mock_requests, recorded):
+        mock_requests.request.return_value = mock.Mock(status_code=304)
+
+        requests.get('http://dinosaurs.sexy', force=True, headers={'If-None-Match': '*'})
+
+        assert mock_requests.request.call_args[1]['headers']['If-None-Match'] == '*'
+
+    def test_no_validators_without_ok_response(self, mock_requests, recorded):
+        recorded.ok = False
+        mock_requests.request.return_value = mock.Mock(
+            ok=True, status_code=200, content='roar', encoding='utf-8', headers={}
+        )
+
+        requests.get('http://dinosaurs.sexy')
+
+        mock_requests.request.assert_called_once_with('get', 'http://dinosaurs.sexy')
+
+
 class TestModel(object):
 
     @pytest.mark.cassandra
@@ -160,9 +930,10 @@ class TestCassandraIntegration(object):
         monkeypatch.setattr(requests.time, 'sleep', mock_sleep)
         mock_requests.request.return_value = mock.Mock(encoding='utf-8', content='Snapcity', status_code=200, headers={'tota': 'dyle'})
 
-        resp = requests.get('dinosaurs.sexy', throttle=2)
+        requests.get('dinosaurs.sexy', throttle=2, force=True)
+        resp = requests.get('dinosaurs.sexy', throttle=2, force=True)
 
-        mock_sleep.assert_called_once_with(2)
+        assert mock_sleep.call_count == 1
         assert mock_requests.request.called is True
         assert isinstance(resp, requests.HarvesterResponse)
 
@@ -3,6 +3,7 @@ import pytest
 
 from scrapi import tasks
 from scrapi import settings
+from scrapi.base import OAIHarvester
 from scrapi.linter import RawDocument
 
 
@@ -135,3 +136,97 @@ def test_process_norm_calls(raw_doc, monkeypatch):
     tasks.process_normalized(raw_doc, raw_doc)
 
     pmock.assert_called_once_with(raw_doc, raw_doc, {})
+
+
+def test_harvest_resumable_hands_off_pages(raw_docs, monkeypatch):
+    harvester = mock.create_autospec(OAIHarvester, instance=True)
+    harvester.short_name = 'test'
+    harvester.harvest_pages.return_value = iter([raw_docs[:5], raw_docs[5:]])
+    mock_begin_norm = mock.MagicMock()
+
+    monkeypatch.setattr('scrapi.tasks.registry', {'test': harvester})
+    monkeypatch.setattr('scrapi.tasks.begin_normalization', mock_begin_norm)
+    monkeypatch.setattr('scrapi.tasks.settings.RESUMABLE_HARVESTS', True)
+
+    result, _ = tasks.harvest('test', 'TIME')
+
+    assert result == []
+    assert mock_begin_norm.delay.call_count == 2
+    harvester.harvest_pages.assert_called_once_with(days_back=1, resumable=True)
+    assert not harvester.harvest.called
+
+
+def test_begin_normalize_batches(raw_docs, monkeypatch):
+    mock_norm = mock.MagicMock()
+    mock_praw = mock.MagicMock()
+    mock_pnorm = mock.MagicMock()
+    harvester = mock.Mock(normalize_batch_size=5)
+
+    monkeypatch.setattr('scrapi.tasks.registry', {'test': harvester})
+    monkeypatch.setattr('scrapi.tasks.normalize_batch', mock_norm)
+    monkeypatch.setattr('scrapi.tasks.process_raw_batch', mock_praw)
+    monkeypatch.setattr('scrapi.tasks.process_normalized_batch', mock_pnorm)
+
+    tasks.begin_normalization((raw_docs, {}), 'test')
+
+    assert mock_norm.si.call_count == 3
+    assert mock_pnorm.s.call_count == 3
+    assert mock_praw.delay.call_count == 3
+
+    for batch in (raw_docs[:5], raw_docs[5:10], raw_docs[10:]):
+        mock_norm.si.assert_any_call(batch, 'test')
+        mock_pnorm.s.assert_any_call(batch)
+        mock_praw.delay.assert_any_call(batch)
+
+    assert all('normalizeTaskCreated' in raw['timestamps'] for raw in raw_docs)
+
+
+def test_batch_size_defaults_to_settings(monkeypatch):
+    monkeypatch.setattr('scrapi.tasks.registry', {'test': mock.Mock(normalize_batch_size=None)})
+    monkeypatch.setattr('scrapi.tasks.settings.NORMALIZE_BATCH_SIZE', 7)
+
+    assert tasks.normalize_batch_size('test') == 7
+    assert tasks.normalize_batch_size('missing') == 7
+
+
+def test_normalize_batch_logs_each_document(raw_docs, monkeypatch):
+    harvester = mock.Mock()
+    harvester.normalize.side_effect = [{'title': 'first'}, None, ValueError('bad record')]
+    mock_dispatch = mock.Mock()
+
+    monkeypatch.setattr('scrapi.tasks.registry', {'test': harvester})
+    monkeypatch.setattr('scrapi.events.dispatch', mock_dispatch)
+
+    for raw in raw_docs[:3]:
+        raw['timestamps'] = {}
+
+    normalized = tasks.normalize_batch(raw_docs[:3], 'test')
+
+    assert normalized[0]['title'] == 'first'
+    assert normalized[1:] == [None, None]
+
+    statuses = [call[0][1] for call in mock_dispatch.call_args_list]
+    assert statuses.count('started') == 3
+    assert statuses.count('completed') == 1
+    assert statuses.count('skipped') == 1
+    assert statuses.count('failed') == 1
+
+
+def test_process_raw_batch_continues_past_failures(raw_docs, monkeypatch):
+    pmock = mock.Mock(side_effect=[None, ValueError('bad record'), None])
+
+    monkeypatch.setattr('scrapi.tasks.processing.process_raw', pmock)
+
+    tasks.process_raw_batch(raw_docs[:3])
+
+    assert pmock.call_args_list == [mock.call(raw_doc, {}) for raw_doc in raw_docs[:3]]
+
+
+def test_process_normalized_batch_calls(raw_docs, monkeypatch):
+    pmock = mock.Mock()
+
+    monkeypatch.setattr('scrapi.tasks.processing.process_normalized', pmock)
+
+    tasks.process_normalized_batch([raw_docs[0], None], raw_docs[:2])
+
+    pmock.assert_called_once_with(raw_docs[0], raw_docs[0], {})
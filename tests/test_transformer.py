@@ -1,13 +1,18 @@
 from __future__ import unicode_literals
 
+import re
 import functools
 
-from scrapi.base import XMLHarvester
+import pytest
+from lxml import etree
+
+from scrapi.base import transformer
+from scrapi.base import XMLHarvester, OAIHarvester
 from scrapi.linter import RawDocument
 from scrapi.base.helpers import updated_schema, pack
 
 from .utils import get_leaves
-from .utils import TEST_SCHEMA, TEST_NAMESPACES, TEST_XML_DOC
+from .utils import TEST_SCHEMA, TEST_NAMESPACES, TEST_XML_DOC, TEST_OAI_DOC
 
 
 class TestHarvester(XMLHarvester):
@@ -26,6 +31,26 @@ class TestHarvester(XMLHarvester):
         }) for _ in xrange(days_back)]
 
 
+class TestRebuiltSchemaHarvester(TestHarvester):
+    short_name = 'testrebuiltschema'
+
+    @property
+    def schema(self):
+        return updated_schema(TEST_SCHEMA, {'title': '//dc:title/node()'})
+
+    @property
+    def namespaces(self):
+        return dict(TEST_NAMESPACES)
+
+
+class TestOAIHarvester(OAIHarvester):
+    long_name = 'TEST'
+    short_name = 'testoaitransform'
+    url = 'TEST'
+    base_url = 'http://test.org/oai'
+    property_list = ['type', 'format', 'date', 'identifier', 'setSpec']
+
+
 class TestTransformer(object):
 
     def setup_method(self, method):
@@ -74,3 +99,141 @@ class TestTransformer(object):
 
             for (k, v) in get_leaves(result.attributes):
                 assert type(v) != functools.partial
+
+
+class TestCompiledPlan(object):
+
+    def setup_method(self, method):
+        self.harvester = TestHarvester()
+        self.doc = etree.XML(TEST_XML_DOC)
+
+    def assert_matches(self, schema):
+        self.harvester.schema = schema
+        assert self.harvester.transform(self.doc) == self.harvester._transform(schema, self.doc)
+
+    def test_matches_test_schema(self):
+        self.assert_matches(TEST_SCHEMA)
+
+    def test_matches_oai_schema(self):
+        harvester = TestOAIHarvester()
+        doc = etree.XML(TEST_OAI_DOC)
+
+        assert harvester.transform(doc) == harvester._transform(harvester.schema, doc)
+
+    def test_matches_quirks(self):
+        self.assert_matches({
+            'skipped': 1,
+            'none': None,
+            'empty': {},
+            'nested': {'deeper': {'title': '//dc:title/node()'}, 'after': '//dc:title/node()'},
+            'no_callable': ['//dc:title/node()'],
+            'ignored_after_callable': ['//dc:title/node()', lambda x: x, '//dc:nothing/node()'],
+            'missing': '//dc:nothing/node()',
+            'many': '//dc:title/node() | //dcq:publisher/node()',
+            'packed': (pack('//dc:title/node()', title1='//dc:title/node()'), lambda title, title1: title + title1),
+        })
+
+    def test_invalid_xpath_fails_on_transform(self):
+        self.harvester.schema = {'title': '//dc:title/node('}
+
+        with pytest.raises(etree.XPathError):
+            self.harvester.transform(self.doc)
+
+    def test_plan_is_reused(self):
+        self.harvester.schema = TEST_SCHEMA
+
+        self.harvester.transform(self.doc)
+        plan = self.harvester._plan()
+        self.harvester.transform(self.doc)
+        assert self.harvester._plan() is plan
+
+        self.harvester.schema = updated_schema(TEST_SCHEMA, {'title': '//dc:title/node()'})
+        assert self.harvester.transform(self.doc)['title'] == 'Test'
+        assert self.harvester._plan() is not plan
+
+    def test_rebuilt_schemas_compile_once(self):
+        harvester = TestRebuiltSchemaHarvester()
+
+        plan = harvester._plan()
+        assert harvester.schema is not harvester.schema
+        assert harvester.transform(self.doc)['title'] == 'Test'
+        assert harvester._plan() is plan
+
+    def test_doepages_schema_is_built_once(self):
+        from scrapi.harvesters.doepages import DoepagesHarvester
+        harvester = DoepagesHarvester()
+
+        plan = harvester._plan()
+        assert harvester.schema is harvester.schema
+        assert harvester._plan() is plan
+
+
+MIXED_DOC = '''
+<record xmlns="http://www.openarchives.org/OAI/2.0/" xmlns:dc="http://purl.org/dc/elements/1.1/">
+    <!-- a comment -->
+    <dc:title>Plain</dc:title>
+    <dc:description>before<![CDATA[ <cdata> ]]>after<dc:em>inner</dc:em>tail<!--c--><?pi x?>end</dc:description>
+    <dc:creator/>
+    <dc:creator>One</dc:creator>
+    <other><dc:creator>Two</dc:creator></other>
+    <dc:subject>outer<dc:subject>nested</dc:subject>after</dc:subject>
+    <dc:subject>last</dc:subject>
+</record>
+'''
+
+
+class TestTagHarvester(TestHarvester):
+    namespaces = OAIHarvester.namespaces
+
+
+class TestTagIndex(object):
+
+    def setup_method(self, method):
+        self.harvester = TestTagHarvester()
+        self.doc = etree.XML(MIXED_DOC)
+
+    def normalized(self, value):
+        # Element reprs include their address
+        if isinstance(value, dict):
+            return {k: self.normalized(v) for k, v in value.items()}
+        if isinstance(value, list):
+            return [self.normalized(v) for v in value]
+        return re.sub(r' at 0x[0-9a-f]+', '', value) if isinstance(value, basestring) else value
+
+    def assert_matches(self, schema, doc):
+        self.harvester.schema = schema
+        assert self.normalized(self.harvester.transform(doc)) == self.normalized(self.harvester._transform(schema, doc))
+
+    def test_matches_xpath(self):
+        schema = {
+            name: '//dc:{}/node()'.format(name)
+            for name in ('title', 'description', 'creator', 'subject', 'em', 'missing')
+        }
+        self.assert_matches(schema, self.doc)
+        self.assert_matches(schema, self.doc[2])
+
+    def test_is_used_for_tag_nodes(self, monkeypatch):
+        self.harvester.schema = {'title': '//dc:title/node()', 'id': '//ns0:record/@id'}
+        plan = dict((key, step) for _, key, step in self.harvester._plan())
+
+        assert plan['title'].func is transformer._evaluate_tag_nodes
+        assert plan['id'].func is transformer._evaluate_xpath
+
+    def test_nested_tags_fall_back(self):
+        index = transformer.TagIndex(self.doc)
+
+        assert index.nodes('{http://purl.org/dc/elements/1.1/}subject') is None
+        assert index.nodes('{http://purl.org/dc/elements/1.1/}creator') == ['One', 'Two']
+
+    def test_unknown_prefix_is_not_bucketed(self):
+        self.harvester.schema = {'title': '//nope:title/node()'}
+
+        with pytest.raises(etree.XPathError):
+            self.harvester.transform(self.doc)
+
+    def test_can_be_disabled(self):
+        self.harvester.bucket_tags = False
+        self.harvester.schema = {'title': '//dc:title/node()'}
+
+        assert self.harvester._plan()[0][2].func is transformer._evaluate_xpath
+        assert self.harvester.transform(self.doc) == {'title': 'Plain'}
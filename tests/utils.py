@@ -194,3 +194,68 @@ TEST_OAI_DOC = '''
     </metadata>
     </record>
 '''
+
+TEST_OAI_PAGE = '''<?xml version="1.0" encoding="UTF-8"?>
+<OAI-PMH xmlns="http://www.openarchives.org/OAI/2.0/">
+    <responseDate>2015-03-30T18:42:36Z</responseDate>
+    <request verb="ListRecords">http://test.org/oai</request>
+    <ListRecords>
+        {records}
+        <resumptionToken>{token}</resumptionToken>
+    </ListRecords>
+</OAI-PMH>
+'''
+
+TEST_OAI_RECORD = '''
+<record>
+    <header{status}>
+        <identifier>{identifier}</identifier>
+        <datestamp>{datestamp}</datestamp>
+        <setSpec>{set_spec}</setSpec>
+    </header>
+    <metadata>
+        <oai_dc:dc xmlns:oai_dc="http://www.openarchives.org/OAI/2.0/oai_dc/" xmlns:dc="http://purl.org/dc/elements/1.1/">
+            <dc:title>Title of {identifier}</dc:title>
+            <dc:creator>Doe, Jane</dc:creator>
+            <dc:identifier>http://test.org/{identifier}</dc:identifier>
+        </oai_dc:dc>
+    </metadata>
+</record>
+'''
+
+
+def oai_page(identifiers, token='', set_spec='publication:test', deleted=(), datestamp='2015-03-30T00:00:00Z'):
+    return str(TEST_OAI_PAGE.format(
+        token=token,
+        records=''.join(
+            TEST_OAI_RECORD.format(
+                identifier=identifier,
+                datestamp=datestamp,
+                set_spec=set_spec,
+                status=' status="deleted"' if identifier in deleted else ''
+            )
+            for identifier in identifiers
+        )
+    ))
+
+
+TEST_OAI_HEADERS = '''<?xml version="1.0" encoding="UTF-8"?>
+<OAI-PMH xmlns="http://www.openarchives.org/OAI/2.0/">
+    <ListIdentifiers>
+        {headers}
+        <resumptionToken>{token}</resumptionToken>
+    </ListIdentifiers>
+</OAI-PMH>
+'''
+
+
+def oai_headers(identifiers, token='', datestamp='2015-03-30T00:00:00Z', deleted=()):
+    return str(TEST_OAI_HEADERS.format(
+        token=token,
+        headers=''.join(
+            '<header{}><identifier>{}</identifier><datestamp>{}</datestamp></header>'.format(
+                ' status="deleted"' if identifier in deleted else '', identifier, datestamp
+            )
+            for identifier in identifiers
+        )
+    ))